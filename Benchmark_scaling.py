@@ -0,0 +1,70 @@
+import sys
+import time
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import Simul_funcs_and_data
+
+# Benchmark parameters
+network_sizes = [1000, 5000, 20000, 50000] # Total number of neurons
+exc_fraction = 0.8 # Fraction of excitatory neurons, as in the default 800/200 network
+t_max = 200 # ms, long enough for synaptic currents to switch on at 100 ms
+dt = 0.1 # ms
+
+# Inter-connectivity dominated network weights (EI, IE, II, EE) for 1000 neurons
+# Weights are scaled by 1000 / N so that each cell receives the same total synaptic input at every network size
+default_weights = (0.00175, 0.00175, 0.00025, 0.0000625)
+
+
+def peak_resident_memory():
+    """
+    Returns the peak resident memory of this process so far in MB.
+    """
+    # ru_maxrss is in bytes on macOS and in kB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_benchmark(number_of_neurons):
+    """
+    Runs a single simulation of the given network size and measures its cost.
+
+    Inputs:
+        number_of_neurons (int): Total number of neurons in the network
+
+    Outputs:
+        wall_time (float): Wall time of the simulation in s, including network construction
+
+        steps_per_second (float): Integration steps per second of wall time
+
+        peak_memory (float): Increase of the process's peak resident memory during the simulation in MB
+    """
+    weights = [weight * 1000 / number_of_neurons for weight in default_weights]
+
+    # Memory is read from the operating system, as tracing allocations would slow the timed simulation down
+    peak_memory_before = peak_resident_memory()
+    start_time = time.perf_counter()
+    Simul_funcs_and_data.simulation(
+        *weights, 1, 1, t_max, dt=dt, static_g_ks=1.5, engine="vectorized",
+        number_of_neurons=number_of_neurons, number_of_exc_neurons=int(exc_fraction * number_of_neurons)
+    )
+    wall_time = time.perf_counter() - start_time
+    peak_memory = peak_resident_memory() - peak_memory_before
+
+    return wall_time, (int(t_max / dt) - 1) / wall_time, peak_memory
+
+
+if __name__ == "__main__":
+    print(f"{'Neurons':>10} {'Wall time (s)':>15} {'Steps / s':>12} {'Peak memory (MB)':>18}")
+
+    for number_of_neurons in network_sizes:
+        # Each size runs in a fresh process so memory measurements are independent
+        # and a size that exhausts memory does not stop the benchmark
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                wall_time, steps_per_second, peak_memory = executor.submit(run_benchmark, number_of_neurons).result()
+            except (MemoryError, BrokenProcessPool) as error:
+                print(f"{number_of_neurons:>10} failed: {type(error).__name__}")
+                continue
+
+        print(f"{number_of_neurons:>10} {wall_time:>15.1f} {steps_per_second:>12.1f} {peak_memory:>18.1f}")
@@ -0,0 +1,339 @@
+import numpy as np
+import os
+import json
+import time
+import hashlib
+import inspect
+import tempfile
+import warnings
+import Simul_funcs_and_data
+from Spike_funcs import SpikeTrains
+
+# Simulation results are stored in 'simulation_cache' next to this module, one compressed .npz file per simulation
+cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulation_cache')
+
+# Least recently used results are deleted once the cache exceeds this size in bytes
+cache_size_limit = 2 * 1024 ** 3
+
+# Hits, misses and uncached runs of cached_simulation() in this process, see cache_report()
+cache_statistics = {"hits": 0, "misses": 0, "uncached": 0, "seconds saved": 0.0}
+
+# simulation() arguments whose runs are never cached, see cached_simulation()
+uncached_arguments = ("checkpoint_time", "resume_from", "synchrony_monitor")
+
+_code_version = None # Checksum of the simulation code and F-I data, see code_version()
+
+
+def code_version():
+    """
+    Returns a checksum of the simulation code and of the F-I curve data. Cached results are only reused while both
+    are unchanged.
+
+    Outputs:
+        checksum (str): SHA-256 hex digest of 'Simul_funcs_and_data.py' and the loaded F-I curve arrays
+    """
+    global _code_version
+
+    if _code_version is None:
+        checksum = hashlib.sha256()
+        with open(Simul_funcs_and_data.__file__, 'rb') as file:
+            checksum.update(file.read())
+
+        fi_data = Simul_funcs_and_data.load_fi_curves()
+        for key in sorted(fi_data):
+            checksum.update(key.encode())
+            checksum.update(np.ascontiguousarray(fi_data[key]).tobytes())
+
+        _code_version = checksum.hexdigest()
+
+    return _code_version
+
+
+def hashable_value(value):
+    """
+    Converts a simulation() argument into a JSON serializable value for cache_key(). Arrays and sparse matrices are
+    replaced by a checksum of their contents. Numbers are brought to one form, so that e.g. True and 1, or 200 and
+    200.0, give the same key.
+
+    Inputs:
+        value: Argument value
+
+    Outputs:
+        hashable_value: JSON serializable representation of value
+    """
+    if hasattr(value, "tocsr"): # SciPy sparse matrix, checked without importing SciPy
+        value = value.tocsr()
+        return {"sparse": [hashable_value(value.indptr), hashable_value(value.indices), hashable_value(value.data)],
+                "shape": list(value.shape)}
+
+    if isinstance(value, np.ndarray):
+        return {"array": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest(),
+                "shape": list(value.shape), "dtype": str(value.dtype)}
+
+    if isinstance(value, (list, tuple)):
+        return [hashable_value(item) for item in value]
+
+    if isinstance(value, np.generic):
+        return hashable_value(value.item())
+
+    if isinstance(value, bool):
+        return int(value)
+
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    if isinstance(value, np.random.SeedSequence):
+        return {"seed sequence": hashable_value(value.entropy), "spawn key": list(value.spawn_key)}
+
+    return value
+
+
+def simulation_arguments(simulation_args, simulation_kwargs):
+    """
+    Matches arguments to the parameters of simulation(), filling in defaults.
+
+    Inputs:
+        simulation_args (tuple): Positional arguments of simulation()
+
+        simulation_kwargs (dict): Keyword arguments of simulation()
+
+    Outputs:
+        arguments (dict): Value of every parameter of simulation(), by name
+    """
+    arguments = inspect.signature(Simul_funcs_and_data.simulation).bind(*simulation_args, **simulation_kwargs)
+    arguments.apply_defaults()
+
+    return arguments.arguments
+
+
+def cache_key(simulation_args, simulation_kwargs, seed):
+    """
+    Computes the content address of a simulation: a checksum of all of its inputs, its seed and code_version().
+    Arguments are matched to the parameters of simulation() and defaults are filled in, so a simulation has the same
+    key whether its arguments are passed positionally, by keyword or left at their defaults. spike_format is left
+    out, as both spike formats are stored alike.
+
+    Inputs:
+        simulation_args (tuple): Positional arguments of simulation()
+
+        simulation_kwargs (dict): Keyword arguments of simulation()
+
+        seed (int, list of ints or numpy SeedSequence): Seed of the simulation
+
+    Outputs:
+        key (str): SHA-256 hex digest identifying the simulation
+    """
+    arguments = {name: value for name, value in simulation_arguments(simulation_args, simulation_kwargs).items()
+                 if name not in ("spike_format", "seed")}
+
+    inputs = {
+        "arguments": {name: hashable_value(value) for name, value in sorted(arguments.items())},
+        "seed": hashable_value(seed),
+        "code version": code_version(),
+    }
+
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def save_result(path, result, dt, run_time):
+    """
+    Writes the output of simulation() to a compressed .npz file. Spike times are stored as integer steps.
+
+    Inputs:
+        path (str): Path of the file to write
+
+        result (tuple): (neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t) returned by simulation(), with
+                        spikes in either spike_format
+
+        dt (float): Integration time step of the simulation in ms
+
+        run_time (float): Wall time of the simulation in s, reported as time saved by later hits
+    """
+    neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t = result
+
+    # Spike steps of each neuron, in the order the neurons are presented
+    spike_steps = []
+    neuron_values = []
+    for neuron_list in (neuron_list_exc_sorted, neuron_list_inh):
+        if isinstance(neuron_list, SpikeTrains):
+            spike_steps += [neuron_list[neuron] for neuron in range(len(neuron_list))]
+            neuron_values.append(neuron_list.values[neuron_list.order])
+        else:
+            spike_steps += [[round(spike_time / dt) for spike_time in neuron["spike times"]]
+                            for neuron in neuron_list.values()]
+            neuron_values.append(np.array([neuron.get("frequency", neuron.get("current random seed"))
+                                           for neuron in neuron_list.values()]))
+
+    # Write to a temporary file first so an interrupted write never leaves a partial entry
+    file_descriptor, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    with os.fdopen(file_descriptor, 'wb') as file:
+        np.savez_compressed(
+            file,
+            spike_steps=np.concatenate([np.asarray(steps, dtype=np.int32) for steps in spike_steps]),
+            spike_counts=np.array([len(steps) for steps in spike_steps], dtype=np.int32),
+            exc_frequencies=neuron_values[0],
+            inh_current_modifiers=neuron_values[1],
+            exc_currs=np.array(exc_currs, dtype=float),
+            g_ks_t=g_ks_t,
+            dt=dt,
+            run_time=run_time,
+        )
+    os.replace(temporary_path, path)
+
+
+def load_result(path, spike_format="dict"):
+    """
+    Reads a simulation() output written by save_result().
+
+    Inputs:
+        path (str): Path of the file to read
+
+        spike_format (str, optional): Format of the spike outputs, "dict" (default) or "arrays", as in simulation()
+
+    Outputs:
+        result (tuple): (neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t), as returned by simulation()
+
+        run_time (float): Wall time of the original simulation in s
+    """
+    with np.load(path) as file:
+        data = {key: file[key] for key in file.files}
+
+    dt = float(data["dt"])
+    offsets = np.concatenate(([0], np.cumsum(data["spike_counts"], dtype=np.int64)))
+    number_of_exc_neurons = len(data["exc_frequencies"])
+
+    # Excitatory neurons are stored already sorted by firing frequency
+    exc_offsets = offsets[:number_of_exc_neurons + 1]
+    inh_offsets = offsets[number_of_exc_neurons:]
+    neuron_list_exc_sorted = SpikeTrains(data["spike_steps"][:exc_offsets[-1]], exc_offsets, dt,
+                                         values=data["exc_frequencies"], value_name="frequency")
+    neuron_list_inh = SpikeTrains(data["spike_steps"][inh_offsets[0]:], inh_offsets - inh_offsets[0], dt,
+                                  values=data["inh_current_modifiers"], value_name="current random seed")
+
+    # Spike times are recomputed as dt * step, exactly as simulation() computes them
+    if spike_format == "dict":
+        neuron_list_exc_sorted = neuron_list_exc_sorted.to_dict()
+        neuron_list_inh = neuron_list_inh.to_dict()
+
+    return (neuron_list_exc_sorted, neuron_list_inh, data["exc_currs"].tolist(), data["g_ks_t"]), float(data["run_time"])
+
+
+def evict_least_recently_used(directory, size_limit):
+    """
+    Deletes the least recently used cache entries until the cache fits within size_limit. Entries are ordered by
+    modification time, which is refreshed on every hit.
+
+    Inputs:
+        directory (str): Cache directory
+
+        size_limit (int): Maximum total size of the cache in bytes
+    """
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.npz'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= size_limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass # Already removed by another process
+        total_size -= size
+
+
+def cached_simulation(*simulation_args, seed=None, directory=None, size_limit=None, **simulation_kwargs):
+    """
+    Runs simulation() with the given seed, or returns its stored result if the same simulation was run before.
+    Results are addressed by a checksum of every input, the seed, the simulation code and the F-I curve data, so
+    changing any of them runs the simulation again.
+
+    Inputs:
+        *simulation_args: Positional arguments of simulation(), e.g. (EI, IE, II, EE, current_modulation,
+                          inh_modulation, t_max)
+
+        seed (int, list of ints, numpy SeedSequence or numpy Generator, optional): Seed passed to simulation().
+            Without a seed the simulation is not reproducible, and a Generator's state changes with every draw, so
+            both run without the cache. Simulations given any of
+            uncached_arguments (checkpoint_time, resume_from or synchrony_monitor) also run without the cache.
+
+        directory (str, optional): Cache directory (default is cache_directory)
+
+        size_limit (int, optional): Maximum total size of the cache in bytes (default is cache_size_limit)
+
+        **simulation_kwargs: Keyword arguments of simulation(). Without Numba, the "numba" engine's simulations run
+                             and are cached as "vectorized" ones, as simulation() falls back to that engine.
+
+    Outputs:
+        result (tuple): (neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t), as returned by simulation()
+                        (followed by the checkpoint if checkpoint_time is given)
+
+        cache_hit (Boolean): Whether the result was read from the cache
+    """
+    # Without a seed the simulation is not reproducible, and a Generator seed cannot be addressed by its contents.
+    # Checkpoints and synchrony monitors are outputs of running the simulation, which a cache hit would skip, so these
+    # simulations also run without the cache.
+    if (seed is None or isinstance(seed, (np.random.Generator, np.random.BitGenerator))
+            or any(simulation_kwargs.get(name) is not None for name in uncached_arguments)):
+        cache_statistics["uncached"] += 1
+        return Simul_funcs_and_data.simulation(*simulation_args, seed=seed, **simulation_kwargs), False
+
+    # Without Numba, simulation() runs the "numba" engine's simulations with the vectorized engine. The fallback is
+    # resolved here so that the result is stored and looked up under the engine that actually ran.
+    arguments = simulation_arguments(simulation_args, simulation_kwargs)
+    if arguments["engine"] == "numba" and Simul_funcs_and_data.import_numba() is None:
+        warnings.warn("Numba is not installed, using the vectorized engine instead")
+        del arguments["seed"]
+        simulation_args, simulation_kwargs = (), dict(arguments, engine="vectorized")
+
+    directory = cache_directory if directory is None else directory
+    size_limit = cache_size_limit if size_limit is None else size_limit
+    path = os.path.join(directory, cache_key(simulation_args, simulation_kwargs, seed) + '.npz')
+
+    try:
+        result, run_time = load_result(path, simulation_kwargs.get("spike_format", "dict"))
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        pass # Missing or unreadable entry, simulate again
+    else:
+        os.utime(path) # Mark as recently used
+        cache_statistics["hits"] += 1
+        cache_statistics["seconds saved"] += run_time
+        return result, True
+
+    start_time = time.perf_counter()
+    result = Simul_funcs_and_data.simulation(*simulation_args, seed=seed, **simulation_kwargs)
+    run_time = time.perf_counter() - start_time
+
+    os.makedirs(directory, exist_ok=True)
+    save_result(path, result, simulation_arguments(simulation_args, simulation_kwargs)["dt"], run_time)
+    evict_least_recently_used(directory, size_limit)
+    cache_statistics["misses"] += 1
+
+    return result, False
+
+
+def cache_report(statistics=None):
+    """
+    Summarizes how many simulations were reused from the cache.
+
+    Inputs:
+        statistics (dict, optional): Counts in the format of cache_statistics, e.g. of a single sweep
+                                     (default is cache_statistics, covering this process)
+
+    Outputs:
+        report (str): Hit and miss counts, share of simulations reused and simulation time saved
+    """
+    statistics = cache_statistics if statistics is None else statistics
+    cacheable = statistics["hits"] + statistics["misses"]
+    reused = 100 * statistics["hits"] / cacheable if cacheable else 0
+
+    report = (f"Simulation cache: {statistics['hits']} hits, {statistics['misses']} misses "
+              f"({reused:.0f}% reused, {statistics['seconds saved']:.1f} s of simulation saved)")
+    if statistics["uncached"]:
+        report += (f", {statistics['uncached']} simulations run without the cache "
+                   f"(unseeded, seeded with a Generator, checkpointed or monitored)")
+
+    return report
@@ -0,0 +1,7 @@
+import Simul_funcs_and_data
+
+# Converts the F-I curve data in 'ficurves.json', 'ficurves_keys.json' and 'ficurves_inh.json'
+# to the binary 'ficurves.npz' that Simul_funcs_and_data loads when applied currents are first needed.
+# Run again after editing or regenerating any of the JSON files.
+Simul_funcs_and_data.convert_fi_curves_json()
+print(f"Wrote {Simul_funcs_and_data.fi_curves_path}")
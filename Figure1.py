@@ -25,60 +25,22 @@ ax2.axhline(y=0, color='grey', linestyle=':', linewidth=1.2)
 # Simulation parameters
 t_max = 3000  # ms
 dt = 0.01  # ms
-steps = int(t_max / dt)
 g_ks_values = np.arange(0, 1.5, 0.1) # F-I curves will be found for 15 g_ks values from 0.0 to 1.5
 spike_threshold = 0  # mV
 
-i_app_array_group = [] # To store current arrays for each F-I curve corresponding to each g_ks value
-freq_array_group = [] # To store frequency arrays for each F-I curve corresponding to each g_ks value
-
-for g_ks in g_ks_values: # Finding F-I curves for each g_ks value
-
-    i_app = np.arange(0, 25.1, 0.05) # Different current values to stimulate neuron with to find corresponding firing frequency
-    spike_times = [[] for num in range(len(i_app))] # To store neuron spike times for each simulation
-
-    for current_index in range(len(i_app)): # A simulation for each current value
-        should_record_spike = True # Spike detection flag
+i_app = np.arange(0, 25.1, 0.05) # Different current values to stimulate neuron with to find corresponding firing frequency
 
-        # Neuron state variables initialization
-        v = np.zeros(5) # Membrane voltage
-        h = np.zeros(5) # Gating variables
-        z = np.zeros(5)
-        n = np.zeros(5)
+# Firing frequency for every g_ks value (rows) and current (columns), all neurons integrated at once
+# Frequency of spikes is number of spikes after 1000 ms, allowing initial transients to decay, divided by (t_max - 1 s) = 2 s
+frequency_arrays = Simul_funcs_and_data.fi_curve_frequencies(g_ks_values, i_app, t_max=t_max, dt=dt, spike_threshold=spike_threshold)
 
-        v[0] = -42 #mV
-        h[0] = 0.5
-        n[0] = 0.5
-        z[0] = 0.2
-
-        for i in range(1, steps):
-            update_no = i % 5 # Updating modulo 5 index to remember only 5 values of v,h,z,n at a time
-
-            # Runge-kutta used to update state variables
-            dh, dn, dz, dv = Simul_funcs_and_data.rk_slope(v[update_no - 1], i_app[current_index], 0, h[update_no - 1], n[update_no - 1], z[update_no - 1], g_ks, timestep=dt)
-            h[update_no], n[update_no], z[update_no], v[update_no] = h[update_no - 1] + dh, n[update_no - 1] + dn, z[
-                update_no - 1] + dz, v[update_no - 1] + dv
-
-            # Store spike time if spike is triggered and modify spike detection flag
-            should_record_spike = Simul_funcs_and_data.record_spike(v[update_no-1], spike_threshold, i, should_record_spike, spike_times[current_index], timestep=dt)
-
-    frequency_array = np.zeros(len(i_app)) # Initialize frequency array
-
-    for freq_index, frequency in enumerate(frequency_array):
-        filtered_spikes = ([spikes for spikes in spike_times[freq_index] if spikes > 1000]) # Consider only spikes after 1000 ms, allowing initial transients to decay
-        frequency_array[freq_index] = len(filtered_spikes) / 2 # Frequency of spikes is number of spikes divided by period over which spikes occured, i.e. (t_max - 1 s) = 2 s
-
-    freq_for_plot = [] # Frequency list for plotting
-    i_app_for_plot = [] # Current list for plotting
+i_app_array_group = [] # To store current arrays for each F-I curve corresponding to each g_ks value
+freq_array_group = [] # To store frequency arrays for each F-I curve corresponding to each g_ks value
 
+for frequency_array in frequency_arrays:
     # Due to depolarization block, with excess current stimulation, neurons may cease to fire, leading to a sharp dip in F-I curve at a certain current threshold
     # We exclude these physiologically unrealistic data points for the F-I curve plot
-    prev_value = 0
-    for freq_index, frequency in enumerate(frequency_array):
-        if frequency != 0 and frequency > prev_value:
-            freq_for_plot.append(frequency)
-            i_app_for_plot.append(i_app[freq_index])
-        prev_value = frequency
+    i_app_for_plot, freq_for_plot = Simul_funcs_and_data.fi_curve_points(i_app, frequency_array)
 
     # Storing F-I curve results for the given g_ks value
     i_app_array_group.append(i_app_for_plot)
@@ -5,32 +5,33 @@ import Plotting_funcs
 
 # Simulations
 t_max = 5500
+warm_up_time = 1000 # g_ks is held at 1.5 mS for the first 1000 ms of both tonic and declining simulations
 
-neurons_exc_inter_dom_tonic_gks, neurons_inh_inter_dom_tonic_gks, exc_currs_tonic_gks, tonic_gks_t = Simul_funcs_and_data.simulation(
-    0.00175, 0.00175, 0.00025, 0.0000625, 1, 1, t_max, static_g_ks=1.5
+# Each declining g_ks simulation continues the warm-up of the tonic g_ks simulation of the same network
+neurons_exc_inter_dom_tonic_gks, neurons_inh_inter_dom_tonic_gks, exc_currs_tonic_gks, tonic_gks_t, warm_up = Simul_funcs_and_data.simulation(
+    0.00175, 0.00175, 0.00025, 0.0000625, 1, 1, t_max, static_g_ks=1.5, checkpoint_time=warm_up_time
 )  # Inter-connectivity dominated network with g_ks set to 1.5 mS
 
 neurons_exc_inter_dom, neurons_inh_inter_dom, exc_currs, g_ks_t = Simul_funcs_and_data.simulation(
-    0.00175, 0.00175, 0.00025, 0.0000625, 1, 1, t_max
+    0.00175, 0.00175, 0.00025, 0.0000625, 1, 1, t_max, resume_from=warm_up
 )  # Inter-connectivity dominated network with cholinergic modulation
 
-neurons_exc_intra_dom_tonic_gks, neurons_inh_intra_dom_tonic_gks, _, _ = Simul_funcs_and_data.simulation(
-    0.00025, 0.00025, 0.0005, 0.000125, 1, 1, t_max, static_g_ks=1.5
+neurons_exc_intra_dom_tonic_gks, neurons_inh_intra_dom_tonic_gks, _, _, warm_up = Simul_funcs_and_data.simulation(
+    0.00025, 0.00025, 0.0005, 0.000125, 1, 1, t_max, static_g_ks=1.5, checkpoint_time=warm_up_time
 )  # Intra-connectivity dominated network with g_ks set to 1.5 mS
 
 neurons_exc_intra_dom, neurons_inh_intra_dom, _, _ = Simul_funcs_and_data.simulation(
-    0.00025, 0.00025, 0.0005, 0.000125, 1, 1, t_max
+    0.00025, 0.00025, 0.0005, 0.000125, 1, 1, t_max, resume_from=warm_up
 )  # Intra-connectivity dominated network with cholinergic modulation
 
-neurons_exc_intra_dom_tonic_gks_2, neurons_inh_intra_dom_tonic_gks_2, _, _ = Simul_funcs_and_data.simulation(
-    0.00025, 0.00025, 0.0005, 0.000125, 1, 0, t_max, static_g_ks=1.5
+neurons_exc_intra_dom_tonic_gks_2, neurons_inh_intra_dom_tonic_gks_2, _, _, warm_up = Simul_funcs_and_data.simulation(
+    0.00025, 0.00025, 0.0005, 0.000125, 1, 0, t_max, static_g_ks=1.5, checkpoint_time=warm_up_time
 )  # Intra-connectivity dominated network with g_ks set to 1.5 mS and inhibitory cell g_ks set to 0 mS
 
 neurons_exc_intra_dom_2, neurons_inh_intra_dom_2, _, _ = Simul_funcs_and_data.simulation(
-    0.00025, 0.00025, 0.0005, 0.000125, 1, 0, t_max
+    0.00025, 0.00025, 0.0005, 0.000125, 1, 0, t_max, resume_from=warm_up
 )  # Intra-connectivity dominated network with cholinergic modulation for only excitatory cells
 
-
 # Figure initialization
 fig = plt.figure(figsize=(10, 10))
 gs = GridSpec(4, 2, height_ratios=[3, 3, 3, 1])
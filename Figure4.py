@@ -1,80 +1,95 @@
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
-import Simul_funcs_and_data
-import Measure_funcs
+import Sweep_funcs
 from matplotlib.lines import Line2D
 
-# Figure initialization
-fig = plt.figure(figsize=(8, 8))
-gs = GridSpec(3, 1)
-
-ax1 = fig.add_subplot(gs[0, 0])
-ax2 = fig.add_subplot(gs[1, 0])
-ax3 = fig.add_subplot(gs[2, 0])
-
-axes = [ax1, ax2, ax3]
-for ax in axes:
-    ax.set_xlim(1.5, 0)
-    ax.set_ylim(0, 1)
-
-# Tonic g_ks simulations and plotting
-static_gks_list = [0.4, 0.7, 1.0] # Tonic g_ks values in mS
-associated_marker_symbol = ['o', 's', '^'] # Markers for each g_ks value in plot
-
-t_max = 2000
-network_structures = [
-    ("inter_dom", 0.00175, 0.00175, 0.00025, 0.0000625, 1, ax1),
-    ("intra_dom", 0.00025, 0.00025, 0.0005, 0.000125, 1, ax2),
-    ("intra_dom_no_inh_mod", 0.00025, 0.00025, 0.0005, 0.000125, 0, ax3),
-]
-
-for gks_idx, static_g_ks in enumerate(static_gks_list):
-    for label, EI, IE, II, EE, inh_mod, ax in network_structures:
-        neurons_exc, neurons_inh, exc_currs, g_ks_t = Simul_funcs_and_data.simulation(
-            EI, IE, II, EE, 1, inh_mod, t_max, static_g_ks = static_g_ks
-        )
-
-        synch_value, g_ks_avg = Measure_funcs.synch_array_generator(
-            neurons_exc, t_max, 0, g_ks_t, 1000
-        )
-
-        ax.plot(static_g_ks, synch_value, color='blue',
-                marker=associated_marker_symbol[gks_idx],
-                markersize=10, linestyle='')
-
-# Dynamic g_ks simulations and plotting
-t_max_list = [2000, 3000, 5000, 9000]
-colors = ['green', 'orange', 'red', 'black']
-
-network_structures = [
-    ("inter_dom", 0.00175, 0.00175, 0.00025, 0.0000625, 1, ax1),
-    ("intra_dom", 0.00025, 0.00025, 0.0005, 0.000125, 1, ax2),
-    ("intra_dom_no_inh_mod", 0.00025, 0.00025, 0.0005, 0.000125, 0, ax3),
-]
-
-for t_max_index in range(len(t_max_list)):
-    t_max = t_max_list[t_max_index]
-    chosen_color = colors[t_max_index]
-    rate_of_gks_decline = 1.5 / (t_max - 1000)
-
-    for label, EI, IE, II, EE, inh_mod, ax in network_structures:
-        neurons_exc, neurons_inh, exc_currs, g_ks_t = Simul_funcs_and_data.simulation(
-            EI, IE, II, EE, 1, inh_mod, t_max
-        )
-
-        synch_array, g_ks_avg_array = Measure_funcs.synch_array_generator(
-            neurons_exc, t_max, 0, g_ks_t
-        )
-
-        ax.plot(g_ks_avg_array, synch_array, color=chosen_color, label=f'Rate of $g_{{ks}}$ decline = {round(rate_of_gks_decline * 1000, 2)} mS / cm$^2$s')
-
-legend_elements = [Line2D([0], [0], marker='o', color='w', markerfacecolor='blue', markersize=10, label=r"$g_{k_{s}}$ = 0.4 mS / cm$^2$"),
-                   Line2D([0], [0], marker='s', color='w', markerfacecolor='blue', markersize=10, label="$g_{k_{s}}$ = 0.7 mS / cm$^2$"),
-                   Line2D([0], [0], marker='^', color='w', markerfacecolor='blue', markersize=10, label="$g_{k_{s}}$ = 1.0 mS / cm$^2$")]
-legend_elements += ax1.get_legend_handles_labels()[0]
-ax2.legend(handles=legend_elements, loc='upper right', fontsize='small')
-
-fig.tight_layout()
-plt.show()
-
-
+# The sweeps' worker processes import this script, so it only runs as the main program
+if __name__ == "__main__":
+    # Figure initialization
+    fig = plt.figure(figsize=(8, 8))
+    gs = GridSpec(3, 1)
+
+    ax1 = fig.add_subplot(gs[0, 0])
+    ax2 = fig.add_subplot(gs[1, 0])
+    ax3 = fig.add_subplot(gs[2, 0])
+
+    axes = [ax1, ax2, ax3]
+    for ax in axes:
+        ax.set_xlim(1.5, 0)
+        ax.set_ylim(0, 1)
+
+    seed = 0 # Fixed so that re-running the figure reuses cached simulations, see Cache_funcs.py
+    replicates = 5 # Independent networks per configuration, giving the 95% confidence intervals of the mean
+
+    # Tonic g_ks simulations and plotting
+    static_gks_list = [0.4, 0.7, 1.0] # Tonic g_ks values in mS
+    associated_marker_symbol = ['o', 's', '^'] # Markers for each g_ks value in plot
+
+    t_max = 2000
+    network_structures = [
+        ("inter_dom", 0.00175, 0.00175, 0.00025, 0.0000625, 1, ax1),
+        ("intra_dom", 0.00025, 0.00025, 0.0005, 0.000125, 1, ax2),
+        ("intra_dom_no_inh_mod", 0.00025, 0.00025, 0.0005, 0.000125, 0, ax3),
+    ]
+
+    # Simulations with each tonic g_ks value (rows) and network structure (columns) run in parallel
+    # A single 1000 ms bin after the 1000 ms warm-up gives one synchrony value per simulation
+    parameter_grid = [
+        [(EI, IE, II, EE, 1, inh_mod, t_max, static_g_ks) for label, EI, IE, II, EE, inh_mod, ax in network_structures]
+        for static_g_ks in static_gks_list
+    ]
+
+    exc_synchrony_mean, exc_synchrony_band, _, _, _ = Sweep_funcs.run_replicates(
+        parameter_grid, replicates, bin_size=1000, seed=seed, cache=True
+    )
+
+    for gks_idx, static_g_ks in enumerate(static_gks_list):
+        for network_idx, (label, EI, IE, II, EE, inh_mod, ax) in enumerate(network_structures):
+            synch_value = exc_synchrony_mean[gks_idx, network_idx, 0]
+            lower, upper = exc_synchrony_band[gks_idx, network_idx, :, 0]
+
+            ax.errorbar(static_g_ks, synch_value, yerr=[[synch_value - lower], [upper - synch_value]], color='blue',
+                        marker=associated_marker_symbol[gks_idx],
+                        markersize=10, linestyle='', capsize=4)
+
+    # Dynamic g_ks simulations and plotting
+    t_max_list = [2000, 3000, 5000, 9000]
+    colors = ['green', 'orange', 'red', 'black']
+
+    network_structures = [
+        ("inter_dom", 0.00175, 0.00175, 0.00025, 0.0000625, 1, ax1),
+        ("intra_dom", 0.00025, 0.00025, 0.0005, 0.000125, 1, ax2),
+        ("intra_dom_no_inh_mod", 0.00025, 0.00025, 0.0005, 0.000125, 0, ax3),
+    ]
+
+    # Simulations with each rate of g_ks decline (rows) and network structure (columns) run in parallel
+    parameter_grid = [
+        [(EI, IE, II, EE, 1, inh_mod, t_max) for label, EI, IE, II, EE, inh_mod, ax in network_structures]
+        for t_max in t_max_list
+    ]
+
+    exc_synchrony_mean, exc_synchrony_band, _, _, g_ks_averages = Sweep_funcs.run_replicates(
+        parameter_grid, replicates, seed=seed + 1, cache=True
+    )
+
+    for t_max_index in range(len(t_max_list)):
+        t_max = t_max_list[t_max_index]
+        chosen_color = colors[t_max_index]
+        rate_of_gks_decline = 1.5 / (t_max - 1000)
+
+        for network_idx, (label, EI, IE, II, EE, inh_mod, ax) in enumerate(network_structures):
+            synch_array = exc_synchrony_mean[t_max_index, network_idx]
+            lower, upper = exc_synchrony_band[t_max_index, network_idx]
+            g_ks_avg_array = g_ks_averages[t_max_index, network_idx]
+
+            ax.plot(g_ks_avg_array, synch_array, color=chosen_color, label=f'Rate of $g_{{ks}}$ decline = {round(rate_of_gks_decline * 1000, 2)} mS / cm$^2$s')
+            ax.fill_between(g_ks_avg_array, lower, upper, color=chosen_color, alpha=0.2)
+
+    legend_elements = [Line2D([0], [0], marker='o', color='w', markerfacecolor='blue', markersize=10, label=r"$g_{k_{s}}$ = 0.4 mS / cm$^2$"),
+                       Line2D([0], [0], marker='s', color='w', markerfacecolor='blue', markersize=10, label="$g_{k_{s}}$ = 0.7 mS / cm$^2$"),
+                       Line2D([0], [0], marker='^', color='w', markerfacecolor='blue', markersize=10, label="$g_{k_{s}}$ = 1.0 mS / cm$^2$")]
+    legend_elements += ax1.get_legend_handles_labels()[0]
+    ax2.legend(handles=legend_elements, loc='upper right', fontsize='small')
+
+    fig.tight_layout()
+    plt.show()
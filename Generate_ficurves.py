@@ -0,0 +1,13 @@
+import sys
+import Simul_funcs_and_data
+
+# Regenerates 'ficurves.json', 'ficurves_keys.json' and 'ficurves_inh.json' by simulating an isolated neuron for every
+# g_ks value (0.0 to 1.5 mS in 0.01 mS increments) and applied current, then rebuilds 'ficurves.npz' from them.
+# Pass finer currents to generate_fi_curves_json() to refine the tables.
+# The shipped files, which every simulation() reads, are only replaced when run with --overwrite
+if "--overwrite" not in sys.argv[1:]:
+    sys.exit("Generate_ficurves.py replaces the shipped F-I curve files, run it with --overwrite to proceed")
+
+Simul_funcs_and_data.generate_fi_curves_json(overwrite=True)
+Simul_funcs_and_data.convert_fi_curves_json()
+print(f"Wrote the F-I curve JSON files and {Simul_funcs_and_data.fi_curves_path}")
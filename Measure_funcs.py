@@ -1,23 +1,28 @@
 import numpy as np
+import functools
+import itertools
+import Spike_funcs
 
 # Functions used for measures
-def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_size=None):
+def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_size=None, engine="vectorized"):
     """
     This function calculates the Golomb synchrony measure (Golomb and Rinzel, 1993/1994) and average g_ks values
     over successive time bins for a specified neuron population (excitatory or inhibitory).
 
     Inputs:
-        neuron_list (dict of dicts):
+        neuron_list (dict of dicts or SpikeTrains):
             Nested dictionary of neurons.
-            - Keys: Integers (0–799 for excitatory or 0–199 for inhibitory)
+            - Keys: Integers (0–799 for excitatory or 0–199 for inhibitory in the default network)
             - Each entry is a dictionary with:
                 - "spike times": List of floats representing spike times in ms
+            or the same population as Spike_funcs.SpikeTrains (simulation() with spike_format="arrays")
 
         t_max (int): Length of simulation in ms
 
         neuron_type (int):
             - 0 for excitatory neurons
             - 1 for inhibitory neurons
+            The number of cells is taken from neuron_list, so any population size is supported.
 
         g_ks_t (numpy array): Time series of g_ks values, one per simulation step.
 
@@ -26,6 +31,8 @@ def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_s
         bin_size (int, optional): Time window size for each synchrony measurement in ms.
                                   Defaults to int(400 / (8000 / (t_max - 1000)))
 
+        engine (str, optional): syncmeasure() engine, e.g. "pairs" for long bins (default is "vectorized")
+
     Outputs:
         synchrony_array (list of floats):
             Golomb synchrony values calculated in each bin over the simulation period
@@ -34,12 +41,9 @@ def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_s
             Average g_ks values corresponding to each bin
     """
 
-    if neuron_type == 0:
-        spike_list_for_golomb = [neuron_list[neuron]["spike times"] for neuron in range(800)]
-        cell_count = 800
-    elif neuron_type == 1:
-        spike_list_for_golomb = [neuron_list[neuron]["spike times"] for neuron in range(200)]
-        cell_count = 200
+    # The population size follows the network simulated (800 excitatory and 200 inhibitory cells by default)
+    cell_count = len(neuron_list)
+    spike_arrays_for_golomb = Spike_funcs.spike_arrays(neuron_list)
 
     if bin_size is None:
         bin_size = int(400 / (8000 / (t_max - 1000)))
@@ -47,23 +51,29 @@ def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_s
     synchrony_array = []
     g_ks_average_array = []
 
-    for bin_number in range(1000, t_max, bin_size):
+    # Spikes of each cell in each bin, located once for all bins. Spike times are in chronological order, so the
+    # spikes with start < time < end, as selected by processSpikesForSync(), form one slice per cell and bin
+    bin_starts = np.arange(1000, t_max, bin_size)
+    window_first = np.array([np.searchsorted(cell_spikes, bin_starts, 'right') for cell_spikes in spike_arrays_for_golomb])
+    window_end = np.array([np.searchsorted(cell_spikes, bin_starts + bin_size, 'left') for cell_spikes in spike_arrays_for_golomb])
+
+    for bin_index, bin_number in enumerate(bin_starts.tolist()):
         measure_start_duration = bin_number
         measure_end_duration = bin_number + bin_size
         measure_length = measure_end_duration - measure_start_duration
 
-        spike_list_window = processSpikesForSync(
-            spike_list_for_golomb,
-            measure_start_duration,
-            measure_end_duration,
-            cell_count
-        )
+        # Spike times from the start of the bin
+        spike_list_window = [
+            cell_spikes[first:end] - measure_start_duration for cell_spikes, first, end in
+            zip(spike_arrays_for_golomb, window_first[:, bin_index].tolist(), window_end[:, bin_index].tolist())
+        ]
 
         synchrony = syncmeasure(
             cell_count,
             spike_list_window,
             gauss_width=2,
-            duration_sec=measure_length / 1000
+            duration_sec=measure_length / 1000,
+            engine=engine
         )
 
         synchrony_array.append(synchrony)
@@ -76,12 +86,95 @@ def synch_array_generator(neuron_list, t_max, neuron_type, g_ks_t, dt=0.1, bin_s
     return synchrony_array, g_ks_average_array
 
 
-def syncmeasure(cellnum, spikes, gauss_width, duration_sec):
+def sliding_synch_array(neuron_list, t_max, g_ks_t, window_size, stride, dt=0.1, start_time=1000, gauss_width=2):
+    """
+    Calculates the Golomb synchrony and average g_ks over sliding time windows of any length and stride, e.g. to
+    locate the onset of desynchronization more finely than the bins of synch_array_generator().
+
+    The smoothed signal of every cell is computed once for the whole simulation, and the variances of golomb_synch()
+    in each window follow from cumulative sums of the signals and of their squares, so the cost barely depends on
+    the number of windows. As the signals are smoothed across window edges, values differ slightly from
+    synch_array_generator() with bin_size = window_size = stride, which smooths each bin on its own.
+
+    Inputs:
+        neuron_list (dict of dicts or SpikeTrains): Spike trains of a population, see synch_array_generator()
+
+        t_max (int): Length of simulation in ms
+
+        g_ks_t (numpy array): Time series of g_ks values, one per simulation step.
+
+        window_size (int): Length of each window in ms
+
+        stride (int): Time between the starts of successive windows in ms
+
+        dt (float, optional): Integration time step in ms (default is 0.1 ms)
+
+        start_time (int, optional): Start of the first window in ms (default is 1000 ms, the end of the warm-up)
+
+        gauss_width (float, optional): Width of the Gaussian kernel in ms (default is 2 ms)
+
+    Outputs:
+        window_starts (numpy array): Start of each window in ms
+
+        synchrony_array (numpy array): Golomb synchrony in each window
+
+        g_ks_average_array (numpy array): Average g_ks in each window
+    """
+    srate = 1000  # Sampling rate in Hz, one sample per ms
+    cell_count = len(neuron_list)
+    Npoints = int(t_max - start_time)
+
+    # Sample of every spike after start_time, as in convert_spiketimes()
+    spike_arrays_for_golomb = Spike_funcs.spike_arrays(neuron_list)
+    spike_cells = np.repeat(np.arange(cell_count), [len(cell_spikes) for cell_spikes in spike_arrays_for_golomb])
+    spike_times = np.concatenate(spike_arrays_for_golomb + [np.zeros(0)]) - start_time
+    counted = (spike_times > 0) & (spike_times < Npoints)
+    sample_index = np.floor(spike_times[counted]).astype(np.int64)
+
+    conv_sig = smooth_spike_samples(spike_cells[counted], sample_index, cell_count, Npoints,
+                                    gaussian_kernel(srate, gauss_width))
+
+    # Cumulative sums over time, starting at 0, of the population signal, its square and the cells' squared signals
+    mean_sig = np.mean(conv_sig, axis=1)
+    mean_sig_sums = np.concatenate(([0], np.cumsum(mean_sig)))
+    mean_sig_square_sums = np.concatenate(([0], np.cumsum(mean_sig ** 2)))
+    square_sums = np.concatenate(([0], np.cumsum(np.sum(conv_sig ** 2, axis=1))))
+
+    # Cumulative sums of each cell's signal, computed in place
+    np.cumsum(conv_sig, axis=0, out=conv_sig)
+    signal_sums = np.concatenate((np.zeros((1, cell_count)), conv_sig))
+
+    # Window bounds in samples
+    window_starts = np.arange(start_time, t_max - window_size + 1, stride)
+    first = window_starts - start_time
+    end = first + window_size
+
+    population_variance = ((mean_sig_square_sums[end] - mean_sig_square_sums[first]) / window_size -
+                           ((mean_sig_sums[end] - mean_sig_sums[first]) / window_size) ** 2)
+    mean_cell_variance = ((square_sums[end] - square_sums[first]) / (window_size * cell_count) -
+                          np.mean(((signal_sums[end] - signal_sums[first]) / window_size) ** 2, axis=1))
+
+    # As in golomb_synch(), including its rescaling by the number of samples of each window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        G = np.sqrt(np.maximum(population_variance, 0) / mean_cell_variance)
+    N = window_size
+    synchrony_array = np.maximum((G - 1 / np.sqrt(N)) / (1 - 1 / np.sqrt(N)), 0)
+
+    # Average g_ks in each window
+    g_ks_sums = np.concatenate(([0], np.cumsum(g_ks_t)))
+    g_ks_first = (window_starts / dt).astype(np.int64)
+    g_ks_end = np.minimum(((window_starts + window_size) / dt).astype(np.int64), len(g_ks_t))
+    g_ks_average_array = (g_ks_sums[g_ks_end] - g_ks_sums[g_ks_first]) / (g_ks_end - g_ks_first)
+
+    return window_starts, synchrony_array, g_ks_average_array
+
+
+def syncmeasure(cellnum, spikes, gauss_width, duration_sec, engine="vectorized"):
     """
     This function calculates the Golomb synchrony measure for a given population of neurons.
 
     Inputs:
-        cellnum (int): Number of neurons in the population (set to 800 for excitatory and 200 for inhibitory).
+        cellnum (int): Number of neurons in the population (800 for excitatory and 200 for inhibitory in the default network).
 
         spikes (list of lists): Each sublist contains spike times in ms for a single neuron.
 
@@ -89,27 +182,47 @@ def syncmeasure(cellnum, spikes, gauss_width, duration_sec):
 
         duration_sec (float): Total duration of the simulation in s.
 
+        engine (str, optional): Method used to build the smoothed time series of each cell.
+            - "vectorized" (default): bins all spikes at once and smooths all cells together, see
+              smoothed_spike_signals()
+            - "loop": converts and convolves the time series cell by cell with convert_spiketimes() and conv_gaussian()
+            Both give the same smoothed time series, and so the same synchrony.
+            - "pairs": computes the variances of golomb_synch() from sums over nearby spike pairs, without building
+              the time series of each cell, see pair_golomb_synch(). Equal to the other engines up to rounding, with
+              a cost that grows with the number of spikes rather than bin length x cells, which suits long bins.
+
     Outputs:
         G_rescaled (float): Golomb synchrony measure quantifying the level of synchronization across neurons. Assumes
                             values from 0 to 1.
     """
 
+    if engine not in ("vectorized", "loop", "pairs"):
+        raise ValueError(f"Unknown engine '{engine}', expected 'vectorized', 'loop' or 'pairs'")
+
     srate = 1000  # Sampling rate in Hz
     duration = duration_sec
     times = np.arange(1000 / srate, duration * 1000 + 1, 1000 / srate)
-    timeseries = np.zeros((int(srate * duration), cellnum))
-
-    # Convert spike times to binary time series at 1000Hz
-    for i in range(cellnum):
-        times, timeseries[:, i] = convert_spiketimes(spikes[i], duration, srate)
 
     if gauss_width <= 0:
         gauss_width = 2
 
-    # Convolve binary time series with Gaussian kernel
-    conv_sig = np.zeros_like(timeseries)
-    for i in range(cellnum):
-        conv_sig[:, i] = conv_gaussian(timeseries[:, i], srate, gauss_width)
+    if engine == "pairs":
+        return pair_golomb_synch(cellnum, spikes, gauss_width, duration, srate)
+
+    if engine == "vectorized":
+        conv_sig = smoothed_spike_signals(cellnum, spikes, gauss_width, duration, srate)
+
+    else:
+        timeseries = np.zeros((int(srate * duration), cellnum))
+
+        # Convert spike times to binary time series at 1000Hz
+        for i in range(cellnum):
+            times, timeseries[:, i] = convert_spiketimes(spikes[i], duration, srate)
+
+        # Convolve binary time series with Gaussian kernel
+        conv_sig = np.zeros_like(timeseries)
+        for i in range(cellnum):
+            conv_sig[:, i] = conv_gaussian(timeseries[:, i], srate, gauss_width)
 
     # Compute Golomb synchrony measure
     G_rescaled, meansig = golomb_synch(conv_sig, times)
@@ -117,6 +230,170 @@ def syncmeasure(cellnum, spikes, gauss_width, duration_sec):
     return G_rescaled
 
 
+def smoothed_spike_signals(cellnum, spikes, gauss_width, duration, srate):
+    """
+    Builds the Gaussian-smoothed spike time series of all cells at once, equal to convert_spiketimes() followed by
+    conv_gaussian() for each cell.
+
+    Inputs:
+        cellnum (int): Number of cells
+
+        spikes (list of lists): Spike times in ms of each cell
+
+        gauss_width (float): Width of the Gaussian kernel in ms
+
+        duration (float): Duration of the time series in s
+
+        srate (int): Sampling rate in Hz
+
+    Outputs:
+        conv_sig (numpy array): (samples x cells) smoothed time series
+    """
+    Npoints = int(duration * srate)
+    spike_cells, sample_index = spike_samples(cellnum, spikes, duration, srate)
+
+    return smooth_spike_samples(spike_cells, sample_index, cellnum, Npoints, gaussian_kernel(srate, gauss_width))
+
+
+def smooth_spike_samples(spike_cells, sample_index, cellnum, Npoints, g):
+    """
+    Convolves the binary time series with a one at each (sample, cell) of a spike with the kernel g, as
+    np.convolve(signal, g, 'same') does for each cell.
+
+    Inputs:
+        spike_cells, sample_index (numpy arrays of ints): Cell and sample of each spike, see spike_samples()
+
+        cellnum (int): Number of cells
+
+        Npoints (int): Number of samples
+
+        g (numpy array): Kernel with an odd number of points, see gaussian_kernel()
+
+    Outputs:
+        conv_sig (numpy array): (samples x cells) smoothed time series
+    """
+    # Binary time series, padded with zeros on both sides for the convolution
+    half_width = len(g) // 2
+    timeseries = np.zeros((Npoints + 2 * half_width, cellnum))
+    timeseries[sample_index + half_width, spike_cells] = 1
+
+    # Sum of shifted copies of the time series
+    conv_sig = np.zeros((Npoints, cellnum))
+    for j in range(len(g)):
+        conv_sig += g[j] * timeseries[2 * half_width - j: 2 * half_width - j + Npoints]
+
+    return conv_sig
+
+
+def pair_golomb_synch(cellnum, spikes, gauss_width, duration, srate):
+    """
+    Computes the Golomb synchrony of golomb_synch() for the smoothed time series of smoothed_spike_signals(), without
+    building them.
+
+    The sum over time of a cell's smoothed signal is the sum of its spikes' kernel weights, and the sum of its square
+    is a sum of kernel overlaps over pairs of its spikes less than a kernel width apart, both truncated at the edges
+    of the bin like np.convolve(..., 'same'). The population signal is the smoothed count of spikes per sample.
+    Work and memory grow with the number of spikes, plus one array over the samples of the bin.
+
+    Inputs:
+        cellnum, spikes, gauss_width, duration, srate: See smoothed_spike_signals()
+
+    Outputs:
+        G_rescaled (float): Golomb synchrony measure, see golomb_synch()
+    """
+    Npoints = int(duration * srate)
+    g = gaussian_kernel(srate, gauss_width)
+    half_width = len(g) // 2
+
+    # Spikes of a cell in the same sample count once, as in the binary time series. Sorted by cell, then sample
+    spike_cells, sample_index = spike_samples(cellnum, spikes, duration, srate)
+    keys = np.unique(spike_cells * Npoints + sample_index)
+    spike_cells = keys // Npoints
+    sample_index = keys % Npoints
+
+    # Sum over time of each cell's signal: the kernel weights falling inside the bin
+    g_cumsum = np.concatenate(([0], np.cumsum(g)))
+    first_weight = np.maximum(half_width - sample_index, 0)
+    last_weight = np.minimum(Npoints + half_width - sample_index, len(g))
+    signal_sums = np.bincount(spike_cells, weights=g_cumsum[last_weight] - g_cumsum[first_weight], minlength=cellnum)
+
+    # Sum over time of each cell's squared signal: kernel overlaps of each spike with itself and with later spikes
+    # of the same cell less than a kernel width away (counted twice, for both orders of the pair)
+    square_sums = np.zeros(cellnum)
+    pair_offset = 0
+    while True:
+        first = np.arange(len(keys) - pair_offset)
+        second = first + pair_offset
+        lag = sample_index[second] - sample_index[first]
+        paired = (spike_cells[second] == spike_cells[first]) & (lag < len(g))
+        if not paired.any():
+            break
+        first, lag = first[paired], lag[paired]
+
+        overlap = np.zeros(len(first))
+        for j in range(len(g) - 1, -1, -1): # Kernel weight j of the first spike at sample k, weight j - lag of the second
+            k = sample_index[first] + j - half_width
+            inside = (j >= lag) & (k >= 0) & (k < Npoints)
+            overlap += np.where(inside, g[j] * g[np.maximum(j - lag, 0)], 0)
+
+        square_sums += np.bincount(spike_cells[first], weights=overlap * (1 if pair_offset == 0 else 2),
+                                   minlength=cellnum)
+        pair_offset += 1
+
+    variances = square_sums / Npoints - (signal_sums / Npoints) ** 2
+
+    # Population signal, the mean of the cells' signals
+    mean_sig = np.convolve(np.bincount(sample_index, minlength=Npoints), g, 'same') / cellnum
+
+    # As in golomb_synch(), including its rescaling by the number of rows of the time series
+    N = Npoints
+    G = np.sqrt(np.var(mean_sig) / np.mean(variances))
+    G_rescaled = (G - 1 / np.sqrt(N)) / (1 - 1 / np.sqrt(N))
+    if G_rescaled < 0:
+        G_rescaled = 0
+
+    return G_rescaled
+
+
+def spike_samples(cellnum, spikes, duration, srate):
+    """
+    Sample index of every spike in the binary time series of convert_spiketimes(), including its clamp of index 1000.
+
+    Inputs:
+        cellnum, spikes, duration, srate: See smoothed_spike_signals()
+
+    Outputs:
+        spike_cells (numpy array of ints): Cell of each spike
+
+        sample_index (numpy array of ints): Sample of each spike
+    """
+    Npoints = int(duration * srate)
+    counts = np.array([len(spikes[i]) for i in range(cellnum)], dtype=np.int64)
+    spike_times = np.fromiter(itertools.chain.from_iterable(spikes[:cellnum]), dtype=float, count=counts.sum())
+
+    sample_index = np.floor(spike_times / (duration * 1000) * Npoints).astype(np.int64)
+    sample_index[sample_index == 1000] = 999
+
+    return np.repeat(np.arange(cellnum), counts), sample_index
+
+
+@functools.lru_cache(maxsize=None)
+def gaussian_kernel(srate, gauss_width):
+    """
+    Gaussian kernel used by conv_gaussian(), with sd 'gauss_width' (ms) at a sampling rate 'srate' (Hz). The kernel
+    is cached, so it must not be modified.
+    """
+    N_gauss = round(6 * (gauss_width / 1000) * srate)
+
+    # Odd number of points, so that the kernel is centrally peaked
+    if (N_gauss % 2) == 0:
+        N_gauss = N_gauss - 1
+    x = np.linspace(-3, 3, N_gauss)
+    g = np.exp(-x ** 2)
+    g.flags.writeable = False
+    return g
+
+
 def convert_spiketimes(spike_times, duration, srate):
     """
     This function takes a vector 'spike_times' (which lists spike times in
@@ -191,3 +468,102 @@ def processSpikesForSync(spikes, start, end, numcells):
     for k in range(numcells):
         spikes_end.append([(j - (start)) for j in spikes[k] if (j > start) and (j < end)])
     return spikes_end
+
+
+class OnlineSynchrony:
+    """
+    Measures the Golomb synchrony of both populations while simulation() runs, over the same bins as
+    synch_array_generator(). Pass it as the synchrony_monitor argument of simulation(). Each bin is measured as soon as
+    the simulation passes its end, and only the spikes of the open bin are kept, so it can be combined with
+    keep_spikes=False to run long simulations without storing their spike history. A monitor can be reused: each
+    simulation() call starts new results.
+
+    Results match synch_array_generator() up to rounding, as cells are summed in simulation order rather than in the
+    sorted order of the excitatory dictionary.
+
+    Attributes:
+        bin_starts (list of ints): Start of each measured bin in ms
+
+        exc_synchrony (list of floats): Golomb synchrony of excitatory cells in each bin
+
+        inh_synchrony (list of floats): Golomb synchrony of inhibitory cells in each bin
+
+        g_ks_averages (list of floats): Average g_ks in each bin
+    """
+
+    def __init__(self, bin_size=None, callback=None):
+        """
+        Inputs:
+            bin_size (int, optional): Time window size for each synchrony measurement in ms, see synch_array_generator()
+
+            callback (function, optional): Called as callback(bin_start, exc_synchrony, inh_synchrony, g_ks_average)
+                                           when each bin is measured, e.g. to watch the synchrony of a long run
+        """
+        self.bin_size = bin_size
+        self.callback = callback
+        self.bin_starts = []
+        self.exc_synchrony = []
+        self.inh_synchrony = []
+        self.g_ks_averages = []
+
+    def begin(self, t_max, dt, g_ks_t, number_of_exc_neurons, number_of_neurons):
+        """
+        Called by simulation() before its first step. Clears the results of any earlier simulation.
+        """
+        self.bin_starts = []
+        self.exc_synchrony = []
+        self.inh_synchrony = []
+        self.g_ks_averages = []
+        self.dt = dt
+        self.g_ks_t = g_ks_t
+        self.number_of_exc_neurons = number_of_exc_neurons
+        self.measured_bin_size = int(400 / (8000 / (t_max - 1000))) if self.bin_size is None else self.bin_size
+        self.pending_bin_starts = list(range(1000, t_max, self.measured_bin_size))[::-1] # Next bin last
+        self.bin_spikes = [[] for neuron_no in range(number_of_neurons)] # Spike times of the open bin, from its start
+
+    def record(self, step, spiked_neurons):
+        """
+        Called by simulation() after every step with the neurons that spiked at that step.
+        """
+        spike_time = self.dt * step
+
+        # Bins end before the spikes of the first step at or after their end
+        while self.pending_bin_starts and spike_time >= self.pending_bin_starts[-1] + self.measured_bin_size:
+            self.measure_bin()
+
+        # As in processSpikesForSync(), spikes at the exact start of a bin are not counted
+        if self.pending_bin_starts and spike_time > self.pending_bin_starts[-1]:
+            for neuron_no in spiked_neurons:
+                self.bin_spikes[neuron_no].append(spike_time - self.pending_bin_starts[-1])
+
+    def finish(self):
+        """
+        Called by simulation() after its last step. Measures the bins left open.
+        """
+        while self.pending_bin_starts:
+            self.measure_bin()
+
+    def measure_bin(self):
+        """
+        Measures the open bin, as synch_array_generator() does, and opens the next one.
+        """
+        start = self.pending_bin_starts.pop()
+        end = start + self.measured_bin_size
+
+        exc_synchrony = syncmeasure(self.number_of_exc_neurons, self.bin_spikes[:self.number_of_exc_neurons],
+                                    gauss_width=2, duration_sec=self.measured_bin_size / 1000)
+        inh_synchrony = syncmeasure(len(self.bin_spikes) - self.number_of_exc_neurons,
+                                    self.bin_spikes[self.number_of_exc_neurons:],
+                                    gauss_width=2, duration_sec=self.measured_bin_size / 1000)
+        g_ks_average = np.mean(self.g_ks_t[int(start / self.dt): int(end / self.dt)])
+
+        self.bin_starts.append(start)
+        self.exc_synchrony.append(exc_synchrony)
+        self.inh_synchrony.append(inh_synchrony)
+        self.g_ks_averages.append(g_ks_average)
+
+        for neuron_spikes in self.bin_spikes:
+            neuron_spikes.clear()
+
+        if self.callback is not None:
+            self.callback(start, exc_synchrony, inh_synchrony, g_ks_average)
@@ -1,69 +1,141 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.patches import Patch
+import Spike_funcs
 
-def configure_spike_raster_plot(ax, neuron_list_exc, neuron_list_inh, time_window):
+def configure_spike_raster_plot(ax, neuron_list_exc, neuron_list_inh, time_window, mode="scatter", density_bins=1000):
     """
     Modifies an Axes object to display a spike raster plot for excitatory and inhibitory neurons.
 
     Inputs:
         ax (matplotlib.axes.Axes): The Axes object to modify for plotting.
 
-        neuron_list_exc (dict of dicts):
+        neuron_list_exc (dict of dicts or SpikeTrains):
             Nested dictionary containing excitatory neurons sorted by firing frequency.
-            - 800 string keys ("0" to "799")
+            - 800 string keys ("0" to "799") in the default network
             - Each key maps to a dictionary with:
                 - "spike times": List of floats representing spike times in ms in chronological order.
+            or the same population as Spike_funcs.SpikeTrains (simulation() with spike_format="arrays")
 
-        neuron_list_inh (dict of dicts):
+        neuron_list_inh (dict of dicts or SpikeTrains):
             Nested dictionary containing inhibitory neurons sorted by firing frequency.
-            - 200 string keys ("0" to "199")
+            - 200 string keys ("0" to "199") in the default network
             - Each key maps to a dictionary with:
                 - "spike times": List of floats representing spike times in ms in chronological order.
+            or the same population as Spike_funcs.SpikeTrains
 
         time_window (tuple):
             Tuple (start_time, end_time) defining x-axis limits in ms.
+
+        mode (str, optional): How spikes are drawn. Only spikes inside time_window are drawn in either mode.
+            - "scatter" (default): one marker per spike, drawn as one collection per population
+            - "density": image of the number of spikes of each neuron in each of density_bins time bins, one per
+              population, whose drawing time does not depend on the number of spikes (e.g. for a whole simulation)
+
+        density_bins (int, optional): Number of time bins of the "density" mode (default is 1000)
     """
+    if mode not in ("scatter", "density"):
+        raise ValueError(f"Unknown mode '{mode}', expected 'scatter' or 'density'")
+
     ax.set_ylabel("Neuron Index", fontsize=12)
     ax.locator_params(axis="y", integer=True, tight=True)
 
-    # Plot excitatory neurons
-    for neuron in range(800):
-        spike_times = neuron_list_exc[neuron]["spike times"]
-        ax.scatter(spike_times, [neuron] * len(spike_times), s=2, color="green",
-                   label="Excitatory Neuron" if neuron == 0 else None)
-
-    # Plot inhibitory neurons
-    for neuron in range(800, 1000):
-        inh_index = neuron - 800
-        spike_times = neuron_list_inh[inh_index]["spike times"]
-        ax.scatter(spike_times, [neuron] * len(spike_times), s=2, color="red",
-                   label="Inhibitory Neuron" if neuron == 800 else None)
+    number_of_exc_neurons = len(neuron_list_exc)
+    number_of_neurons = number_of_exc_neurons + len(neuron_list_inh)
+
+    # Inhibitory neurons are shown above the excitatory ones
+    populations = [
+        (neuron_list_exc, 0, "green", "Greens", "Excitatory Neuron"),
+        (neuron_list_inh, number_of_exc_neurons, "red", "Reds", "Inhibitory Neuron"),
+    ]
+
+    legend_handles = []
+    for neuron_list, first_row, color, colormap, label in populations:
+        spike_times, rows = window_spikes(neuron_list, time_window)
+        rows += first_row
+
+        if mode == "scatter":
+            legend_handles.append(ax.scatter(spike_times, rows, s=2, color=color, label=label))
+        else:
+            counts, _, _ = np.histogram2d(rows, spike_times, bins=(len(neuron_list), density_bins),
+                                          range=((first_row, first_row + len(neuron_list)), time_window))
+            # Neurons without spikes in a bin are left transparent
+            ax.imshow(np.ma.masked_equal(counts, 0), cmap=colormap, vmin=0, aspect='auto', origin='lower',
+                      interpolation='nearest',
+                      extent=(time_window[0], time_window[1], first_row - 0.5, first_row + len(neuron_list) - 0.5))
+            legend_handles.append(Patch(color=color, label=label)) # Images have no legend entry of their own
 
     ax.set_xlim(time_window)
-    ax.legend(loc='best')
+    if mode == "density":
+        ax.set_ylim(-0.5, number_of_neurons - 0.5)
+    ax.legend(handles=legend_handles, loc='best')
 
     return ax
 
 
-def plot_exc_curr_and_g_ks(ax, t_max, g_ks_t, exc_currs, time_window, dt = 0.1):
+def window_spikes(neuron_list, time_window):
+    """
+    Lists the spikes of a population inside a time window, for drawing them at once.
+
+    Inputs:
+        neuron_list (dict of dicts or SpikeTrains): Spike trains of a population, see configure_spike_raster_plot()
+
+        time_window (tuple): Tuple (start_time, end_time) in ms
+
+    Outputs:
+        spike_times (numpy array): Time in ms of each spike with start_time <= time <= end_time
+
+        rows (numpy array of ints): Neuron index of each spike
+    """
+    spike_arrays = Spike_funcs.spike_arrays(neuron_list)
+
+    # Spike times are in chronological order, so each neuron's spikes in the window form a slice
+    window_slices = [
+        neuron_spikes[np.searchsorted(neuron_spikes, time_window[0], 'left'):
+                      np.searchsorted(neuron_spikes, time_window[1], 'right')]
+        for neuron_spikes in spike_arrays
+    ]
+    spike_times = np.concatenate(window_slices + [np.zeros(0)])
+    rows = np.repeat(np.arange(len(window_slices)), [len(neuron_spikes) for neuron_spikes in window_slices])
+
+    return spike_times, rows
+
+
+def plot_exc_curr_and_g_ks(ax, t_max, g_ks_t, exc_currs, time_window, dt = 0.1, max_points=None):
     """
     Generates a plot with two y-axes:
     - The left y-axis plots the excitatory current (`I_app`) in green.
     - The right y-axis plots the `g_ks_t` values in blue.
 
+    Only the samples inside time_window are drawn. If there are more than max_points of them, each trace is reduced
+    to the minimum and maximum of successive groups of samples (see min_max_decimate()), which looks the same at the
+    resolution of the figure.
+
     Inputs:
         ax (matplotlib.axes.Axes): The Axes object to modify for plotting.
         t_max (float): Length of simulation in ms
         g_ks_t (numpy array): Time series of g_ks values, one per simulation step.
-        exc_currs (list of floats): Applied current in µA to an excitatory neuron with average firing frequency,
-        given as a list of values at each simulation step.
+        exc_currs (list of floats or numpy array): Applied current in µA to an excitatory neuron with average firing
+        frequency, one value per simulation step.
         time_window (tuple):
             Tuple (start_time, end_time) defining x-axis limits in ms.
         dt (float, optional): Integration time step in ms (default is 0.1 ms)
+        max_points (int, optional): Maximum number of points drawn per trace. Defaults to twice the width of the Axes
+                                    in pixels.
     """
-    # Create time range based on t_max and dt
+    # Samples are placed on np.linspace(0, t_max, steps), as in the full time range previously plotted
     steps = int(t_max / dt)
-    t_range = np.linspace(0, t_max, steps)
+    sample_spacing = t_max / (steps - 1)
+
+    # Visible samples, with one more on each side so the lines reach the edges of the window
+    first_sample = max(int(np.floor(time_window[0] / sample_spacing)) - 1, 0)
+    end_sample = min(int(np.ceil(time_window[1] / sample_spacing)) + 2, steps)
+    t_range = np.arange(first_sample, end_sample) * sample_spacing
+    g_ks_window = np.asarray(g_ks_t[first_sample:end_sample], dtype=float)
+    exc_currs_window = np.asarray(exc_currs[first_sample:end_sample], dtype=float)
+
+    if max_points is None:
+        max_points = 2 * max(int(ax.get_window_extent().width), 1)
 
     # Set up the left y-axis (for excitatory current)
     ax.set_xlabel('Time (ms)', fontsize=12)
@@ -78,8 +150,8 @@ def plot_exc_curr_and_g_ks(ax, t_max, g_ks_t, exc_currs, time_window, dt = 0.1):
     ax_twin.tick_params(axis='y', colors='blue')
 
     # Plot the data
-    ax_twin.plot(t_range, g_ks_t[:steps], color='blue', label="g_ks_t")
-    ax.plot(t_range, exc_currs, color='green', label="Excitatory Current")
+    ax_twin.plot(*min_max_decimate(t_range, g_ks_window, max_points), color='blue', label="g_ks_t")
+    ax.plot(*min_max_decimate(t_range, exc_currs_window, max_points), color='green', label="Excitatory Current")
 
     # Add the legend
     ax.legend(loc='upper left')
@@ -87,3 +159,34 @@ def plot_exc_curr_and_g_ks(ax, t_max, g_ks_t, exc_currs, time_window, dt = 0.1):
     return ax
 
 
+def min_max_decimate(times, values, max_points):
+    """
+    Reduces a trace to at most max_points points by keeping, from each group of successive samples, its minimum and
+    maximum in chronological order. The drawn envelope is unchanged when each group spans at most a pixel.
+
+    Inputs:
+        times (numpy array): Time of each sample
+
+        values (numpy array): Value of each sample
+
+        max_points (int): Maximum number of points returned
+
+    Outputs:
+        times, values (numpy arrays): Decimated trace, or the input trace if it already has at most max_points samples
+    """
+    if len(values) <= max_points:
+        return times, values
+
+    # Groups of equal size, the last one padded with its final sample. Recounting the groups for the chosen size leaves
+    # less than a group of padding, and argmin and argmax return the first of equal values, so no padding is kept
+    group_size = int(np.ceil(len(values) / max(max_points // 2, 1)))
+    groups = int(np.ceil(len(values) / group_size))
+    padded_values = np.pad(values, (0, groups * group_size - len(values)), mode='edge').reshape(groups, group_size)
+
+    offsets = group_size * np.arange(groups)
+    minimum_index = offsets + np.argmin(padded_values, axis=1)
+    maximum_index = offsets + np.argmax(padded_values, axis=1)
+    kept = np.stack((np.minimum(minimum_index, maximum_index), np.maximum(minimum_index, maximum_index)),
+                    axis=1).reshape(-1)
+
+    return times[kept], values[kept]
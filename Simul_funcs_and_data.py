@@ -1,25 +1,158 @@
 import numpy as np
 import json
-import decimal
+import os
+import tempfile
+import functools
+import types
+import warnings
 from bisect import bisect_left
+from Spike_funcs import SpikeTrains
+
+sparse = None # scipy.sparse, optional and only imported for sparse connectivity, see import_sparse()
+
+numba = None # Optional and only imported for the "numba" simulation engine, see import_numba()
+
+def import_sparse():
+    """
+    Imports scipy.sparse on first use. Importing SciPy is slow, so dense simulations never import it.
+
+    Outputs:
+        sparse (module or None): scipy.sparse, or None if SciPy is not installed
+    """
+    global sparse
+
+    if sparse is None:
+        try:
+            from scipy import sparse as scipy_sparse
+        except ImportError:
+            return None
+        sparse = scipy_sparse
+
+    return sparse
+
+def import_numba():
+    """
+    Imports Numba on first use. Importing Numba is slow, so only the "numba" engine imports it.
+
+    Outputs:
+        numba (module or None): numba, or None if Numba is not installed
+    """
+    global numba
+
+    if numba is None:
+        try:
+            import numba as numba_module
+        except ImportError:
+            return None
+        numba = numba_module
+
+    return numba
 
 # Data used in simulation
-with open('ficurves.json', 'r') as file:
-    fi_curves = json.load(file)
-    # F-I curves stored as a nested dictionary
-    # The outer dictionary has 151 string keys representing g_ks values (in mS) from "0.0" to "1.5" in 0.01 increments
-    # Each inner dictionary maps frequencies (Hz) to the current (µA) needed to trigger neuron oscillations at that frequency for the given g_ks value
-
-with open('ficurves_keys.json', 'r') as file:
-    fi_curves_keys = json.load(file)
-    # A list of lists, where each inner list contains the available frequency keys (in Hz) for a specific g_ks value
-    # First list corresponds to g_ks 0.0 mS and the final list corresponds to 1.5 mS, with 0.01 mS increments in each list
-
-with open('ficurves_inh.json', 'r') as file:
-    inh_currents = json.load(file)
-    # Dictionary to use for applied currents of inhibitory cells
-    # The dictionary has 151 string keys representing g_ks values (in mS) from "0.0" to "1.5" in 0.01 increments
-    # Values are currents required to keep neurons slightly below the threshold current required to elicit spikes at the given g_ks value
+# F-I curve data is stored in 'ficurves.npz' next to this module and loaded on first use (see load_fi_curves())
+# The original JSON files 'ficurves.json', 'ficurves_keys.json' and 'ficurves_inh.json' can be converted with convert_fi_curves_json()
+module_directory = os.path.dirname(os.path.abspath(__file__))
+fi_curves_path = os.path.join(module_directory, 'ficurves.npz')
+_fi_data = None # Loaded F-I curve data, see load_fi_curves()
+
+def convert_fi_curves_json(json_directory=module_directory, output_path=fi_curves_path):
+    """
+    Converts the F-I curve data in 'ficurves.json', 'ficurves_keys.json' and 'ficurves_inh.json' to the binary
+    format read by load_fi_curves().
+
+    'ficurves.json' is a nested dictionary. The outer dictionary has 151 string keys representing g_ks values (in mS)
+    from "0.0" to "1.5" in 0.01 increments. Each inner dictionary maps frequencies (Hz) to the current (µA) needed to
+    trigger neuron oscillations at that frequency for the given g_ks value.
+    'ficurves_keys.json' lists the available frequency keys (in Hz) of each g_ks value, in the same order.
+    'ficurves_inh.json' maps the same g_ks keys to the currents used for inhibitory cells, which keep neurons slightly
+    below the threshold current required to elicit spikes at the given g_ks value.
+
+    Inputs:
+        json_directory (str, optional): Directory containing the three JSON files (default is this module's directory)
+
+        output_path (str, optional): Path of the .npz file to write (default is 'ficurves.npz' in this module's directory)
+
+    Outputs:
+        fi_data (dict): The converted data, as returned by load_fi_curves()
+    """
+    with open(os.path.join(json_directory, 'ficurves.json'), 'r') as file:
+        fi_curves_json = json.load(file)
+    with open(os.path.join(json_directory, 'ficurves_keys.json'), 'r') as file:
+        fi_curves_keys_json = json.load(file)
+    with open(os.path.join(json_directory, 'ficurves_inh.json'), 'r') as file:
+        inh_currents_json = json.load(file)
+
+    g_ks_keys = list(fi_curves_json)
+    frequency_counts = np.array([len(keys) for keys in fi_curves_keys_json], dtype=np.int64)
+
+    # Ragged F-I curves are stored as rows padded with NaN
+    frequencies = np.full((len(g_ks_keys), frequency_counts.max()), np.nan)
+    currents = np.full((len(g_ks_keys), frequency_counts.max()), np.nan)
+    for g_ks_bin, g_ks_key in enumerate(g_ks_keys):
+        keys = fi_curves_keys_json[g_ks_bin]
+        frequencies[g_ks_bin, :len(keys)] = keys
+        currents[g_ks_bin, :len(keys)] = [fi_curves_json[g_ks_key][str(frequency)] for frequency in keys]
+
+    fi_data = {
+        "g_ks_keys": np.array(g_ks_keys),
+        "frequencies": frequencies,
+        "currents": currents,
+        "frequency_counts": frequency_counts,
+        "inh_currents": np.array([inh_currents_json[g_ks_key] for g_ks_key in g_ks_keys]),
+    }
+    np.savez_compressed(output_path, **fi_data)
+
+    return fi_data
+
+def load_fi_curves():
+    """
+    Loads the F-I curve data used to set applied currents. The data is read once and cached for later calls.
+    If 'ficurves.npz' is missing, the data is converted from the JSON files without writing it to disk.
+
+    Outputs:
+        fi_data (dict):
+            - "g_ks_keys": Strings representing g_ks values (in mS), 151 from "0.0" to "1.5" in 0.01 increments in the
+              shipped tables
+            - "frequencies": (g_ks values x max frequencies) array of available frequencies (Hz) for each g_ks value, in
+              increasing order and padded with NaN
+            - "currents": Array of the same shape holding the current (µA) needed to trigger neuron oscillations at
+              each frequency for the given g_ks value
+            - "frequency_counts": Number of available frequencies for each g_ks value
+            - "inh_currents": Currents (µA) used for inhibitory cells at each g_ks value, slightly below the threshold
+              current required to elicit spikes
+    """
+    global _fi_data
+
+    if _fi_data is None:
+        if os.path.exists(fi_curves_path):
+            with np.load(fi_curves_path) as file:
+                _fi_data = {key: file[key] for key in file.files}
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                _fi_data = convert_fi_curves_json(output_path=os.path.join(directory, 'ficurves.npz'))
+
+    return _fi_data
+
+def __getattr__(name):
+    # The dictionaries previously loaded from JSON at import are rebuilt on request for backward compatibility
+    if name in ("fi_curves", "fi_curves_keys", "inh_currents"):
+        fi_data = load_fi_curves()
+        g_ks_keys = [str(g_ks_key) for g_ks_key in fi_data["g_ks_keys"]]
+        fi_curves_keys = [
+            fi_data["frequencies"][g_ks_bin, :count].tolist() for g_ks_bin, count in enumerate(fi_data["frequency_counts"])
+        ]
+        if name == "fi_curves_keys":
+            return fi_curves_keys
+        if name == "inh_currents":
+            return dict(zip(g_ks_keys, fi_data["inh_currents"].tolist()))
+        return {
+            g_ks_key: {
+                str(frequency): current
+                for frequency, current in zip(fi_curves_keys[g_ks_bin], fi_data["currents"][g_ks_bin].tolist())
+            }
+            for g_ks_bin, g_ks_key in enumerate(g_ks_keys)
+        }
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Simulation parameters
 E_na = 55  # Na channel reversal potential in mV
@@ -32,6 +165,14 @@ g_na = 24  # Maximum conductance of Na channel in mS
 g_kd = 3  # Maximum conductance of Delayed Rectifier K channel in mS
 g_l = 0.02  # Maximum conductance of Leak channel in mS
 
+# simulation() called with connectivity="auto" stores the connectivity as CSR matrices when at most
+# sparse_connectivity_density of the possible synapses exist, where their matrix-vector product is clearly faster
+# than the dense one. With all four connection types about 36% exist, at which the CSR product is no faster but CSR
+# storage (12 bytes per synapse) is about half the size of dense storage (8 bytes per neuron pair). CSR is then only
+# used once the dense matrix would exceed sparse_connectivity_memory bytes (about 11600 neurons)
+sparse_connectivity_density = 0.2
+sparse_connectivity_memory = 2 ** 30
+
 # Functions used in simulation
 def create_g_ks_t(t_max, g_ks_zero_time=None, timestep = 0.1):
     """
@@ -71,6 +212,173 @@ def create_g_ks_t(t_max, g_ks_zero_time=None, timestep = 0.1):
 
     return g_ks_t
 
+def connectivity_blocks(EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength,
+                        EE_connectivity_strength, number_of_exc_neurons, number_of_inh_neurons):
+    """
+    Lists the four connection types of the E-I network, see build_connectivity().
+
+    Outputs:
+        blocks (list of tuples): (postsynaptic cells, presynaptic cells, synaptic weight, probability of synapse) of
+            the EE, IE, EI and II connections, with the cells given as slices of the connectivity matrix
+    """
+    exc = slice(0, number_of_exc_neurons)
+    inh = slice(number_of_exc_neurons, number_of_exc_neurons + number_of_inh_neurons)
+
+    return [
+        (exc, exc, EE_connectivity_strength, 0.3),
+        (exc, inh, IE_connectivity_strength, 0.5),
+        (inh, exc, EI_connectivity_strength, 0.5),
+        (inh, inh, II_connectivity_strength, 0.3),
+    ]
+
+def expected_connection_density(EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength,
+                                EE_connectivity_strength, number_of_exc_neurons=800, number_of_inh_neurons=200):
+    """
+    Returns the expected fraction of nonzero entries of the connectivity matrix drawn by build_connectivity().
+    Connection types with zero weight have no synapses.
+
+    Outputs:
+        density (float): Expected number of synapses divided by the number of matrix entries
+    """
+    number_of_neurons = number_of_exc_neurons + number_of_inh_neurons
+    expected_synapses = 0
+    for post, pre, weight, probability_of_synapse in connectivity_blocks(
+            EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength, EE_connectivity_strength,
+            number_of_exc_neurons, number_of_inh_neurons):
+        if weight != 0:
+            block_size = (post.stop - post.start) * (pre.stop - pre.start)
+            if post == pre:
+                block_size -= post.stop - post.start # No self-synapses
+            expected_synapses += probability_of_synapse * block_size
+
+    return expected_synapses / number_of_neurons ** 2
+
+def connection_density(g_syn):
+    """
+    Returns the fraction of nonzero entries of a dense or SciPy sparse connectivity matrix.
+    """
+    if hasattr(g_syn, "tocsr"): # SciPy sparse matrix
+        return g_syn.count_nonzero() / np.prod(g_syn.shape)
+
+    return np.count_nonzero(g_syn) / g_syn.size
+
+def use_sparse_connectivity(density, number_of_neurons):
+    """
+    Decides whether connectivity="auto" stores a connectivity matrix as SciPy CSR matrices, see
+    sparse_connectivity_density.
+
+    Inputs:
+        density (float): Fraction of the possible synapses that exist, see expected_connection_density()
+
+        number_of_neurons (int): Total number of neurons in the network
+
+    Outputs:
+        use_sparse (Boolean): True if the matrix should be sparse and SciPy is installed
+    """
+    dense_bytes = 8 * number_of_neurons ** 2
+    sparse_bytes = 12 * density * number_of_neurons ** 2
+    smaller_and_large = sparse_bytes < dense_bytes and dense_bytes > sparse_connectivity_memory
+
+    return (density <= sparse_connectivity_density or smaller_and_large) and import_sparse() is not None
+
+def build_connectivity(EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength,
+                       EE_connectivity_strength, number_of_exc_neurons=800, number_of_inh_neurons=200, rng=None,
+                       sparse_output=False):
+    """
+    Draws the connectivity matrix of the E-I network described under Network Structure in Materials and Methods.
+    Each synapse exists independently with probability 0.3 (EE and II connections) or 0.5 (EI and IE connections),
+    and has the weight of its connection type. Self-synapses are removed.
+
+    Inputs:
+        EI_connectivity_strength (float): Synaptic weight of excitatory to inhibitory connections in mS
+
+        IE_connectivity_strength (float): Synaptic weight of inhibitory to excitatory connections in mS
+
+        II_connectivity_strength (float): Synaptic weight of inhibitory to inhibitory connections in mS
+
+        EE_connectivity_strength (float): Synaptic weight of excitatory to excitatory connections in mS
+
+        number_of_exc_neurons (int, optional): Number of excitatory neurons (default is 800)
+
+        number_of_inh_neurons (int, optional): Number of inhibitory neurons (default is 200)
+
+        rng (numpy.random.Generator, optional): Random number generator used to draw the synapses
+
+        sparse_output (Boolean, optional): Return a SciPy CSR matrix instead of a dense array (requires SciPy)
+
+    Outputs:
+        g_syn (numpy array or scipy.sparse.csr_matrix):
+            (neurons x neurons) connectivity matrix. Rows are postsynaptic and columns presynaptic neurons,
+            excitatory neurons come first.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if sparse_output and import_sparse() is None:
+        raise ImportError("sparse_output=True requires SciPy")
+
+    number_of_neurons = number_of_exc_neurons + number_of_inh_neurons
+    blocks = connectivity_blocks(EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength,
+                                 EE_connectivity_strength, number_of_exc_neurons, number_of_inh_neurons)
+
+    if not sparse_output:
+        g_syn = np.zeros((number_of_neurons, number_of_neurons))
+        for post, pre, weight, probability_of_synapse in blocks:
+            block_shape = (post.stop - post.start, pre.stop - pre.start)
+            g_syn[post, pre] = np.where(rng.random(block_shape) < probability_of_synapse, weight, 0)
+        np.fill_diagonal(g_syn, 0) # No self-synapses
+        return g_syn
+
+    # Sparse matrices are drawn in chunks of rows to avoid allocating the full dense mask. Each chunk only keeps the
+    # int32 presynaptic indices of its synapses and the number of synapses of each row
+    rows_per_chunk = max(1, 2 ** 22 // number_of_neurons)
+    chunk_columns = []
+    for post, pre, weight, probability_of_synapse in blocks:
+        block_chunks = []
+        for chunk_start in range(post.start, post.stop, rows_per_chunk):
+            chunk_stop = min(chunk_start + rows_per_chunk, post.stop)
+            # Blocks without weight still consume their draws, so both backends draw the same network from a seed
+            connected = rng.random((chunk_stop - chunk_start, pre.stop - pre.start)) < probability_of_synapse
+            if weight == 0:
+                connected[:] = False
+            elif post == pre:
+                chunk_rows = np.arange(chunk_stop - chunk_start)
+                connected[chunk_rows, chunk_rows + chunk_start - pre.start] = False # No self-synapses
+            columns = (np.flatnonzero(connected) % connected.shape[1] + pre.start).astype(np.int32)
+            block_chunks.append((np.count_nonzero(connected, axis=1), columns, weight))
+        chunk_columns.append(block_chunks)
+
+    # Every row chunk of a postsynaptic population has a chunk in both of its blocks, (EE, IE) and (EI, II), which are
+    # merged row by row into the CSR arrays of the full matrix
+    postsynaptic_blocks = (chunk_columns[0:2], chunk_columns[2:4])
+    row_counts = np.concatenate([exc_chunk[0] + inh_chunk[0] for block_from_exc, block_from_inh in postsynaptic_blocks
+                                 for exc_chunk, inh_chunk in zip(block_from_exc, block_from_inh)])
+    indptr = np.zeros(number_of_neurons + 1, dtype=np.int64)
+    np.cumsum(row_counts, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.empty(indptr[-1])
+
+    chunk_start = 0
+    for block_from_exc, block_from_inh in postsynaptic_blocks:
+        while block_from_exc:
+            # Chunks are released once merged
+            (exc_counts, exc_columns, exc_weight), (inh_counts, inh_columns, inh_weight) = (block_from_exc.pop(0),
+                                                                                            block_from_inh.pop(0))
+            chunk_stop = chunk_start + len(exc_counts)
+            chunk_rows = np.arange(len(exc_counts))
+            # Stable sort by row keeps the excitatory presynaptic cells of each row before the inhibitory ones
+            order = np.argsort(np.concatenate((np.repeat(chunk_rows, exc_counts), np.repeat(chunk_rows, inh_counts))),
+                               kind="stable")
+            indices[indptr[chunk_start]:indptr[chunk_stop]] = np.concatenate((exc_columns, inh_columns))[order]
+            data[indptr[chunk_start]:indptr[chunk_stop]] = np.repeat((exc_weight, inh_weight),
+                                                                     (len(exc_columns), len(inh_columns)))[order]
+            chunk_start = chunk_stop
+
+    if indptr[-1] < 2 ** 31:
+        indptr = indptr.astype(np.int32)
+
+    return sparse.csr_matrix((data, indices, indptr), shape=(number_of_neurons, number_of_neurons))
+
 def m_inf(voltage):
     return 1 / (1 + np.exp((-voltage - 30) / 9.5))
 
@@ -160,6 +468,117 @@ def rk_slope(voltage, app_current, syn_current, h_gate, n_gate, z_gate, g_ks, ti
 
     return dh, dn, dz, dv
 
+# Gating functions evaluated together by rk4_population_step(). Each is a + b / (1 + exp(slope * voltage + offset)),
+# for m_inf, h_inf, n_inf, z_inf, tau_h and tau_n in that order
+gating_slopes = np.array([-1 / 9.5, 1 / 7.0, -1 / 10, -1 / 5, 1 / 6, 1 / 15])
+gating_offsets = np.array([-30 / 9.5, 53 / 7.0, -30 / 10, -39 / 5, 40.5 / 6, 27 / 15])
+gating_scales = np.array([2.78, 1.85]) # b of tau_h and tau_n, a is 0.37 for both (a = 0 and b = 1 for the others)
+
+def rk4_buffers(shape):
+    """
+    Allocates the work arrays of rk4_population_step() for a population of neurons of the given shape.
+
+    Inputs:
+        shape (tuple of ints): Shape of the population's state arrays, e.g. (neurons,)
+
+    Outputs:
+        buffers (dict of numpy arrays): Work arrays, reused at every step
+    """
+    broadcast = (-1,) + (1,) * len(shape)
+    return {
+        "stage": np.zeros((4,) + shape), # v, h, n and z at which the slopes of a stage are evaluated
+        "slope": np.zeros((4,) + shape), # Change of v, h, n and z over a time step at the stage's slopes
+        "weighted": np.zeros((4,) + shape),
+        "total": np.zeros((4,) + shape), # Weighted sum of the four stages' changes
+        "gating": np.zeros((6,) + shape), # Gating functions, see gating_slopes
+        "drive": np.zeros(shape),
+        "term": np.zeros(shape),
+        "factor": np.zeros(shape),
+        "gating_slopes": gating_slopes.reshape(broadcast),
+        "gating_offsets": gating_offsets.reshape(broadcast),
+        "gating_scales": gating_scales.reshape(broadcast),
+    }
+
+def rk4_population_step(state, app_current, syn_current, g_ks, timestep, buffers):
+    """
+    Advances a population of neurons by one 4th-order Runge-Kutta step, in place. Computes the update of rk_slope()
+    with a fixed number of NumPy calls per step: the six gating functions of a stage share one exponential, v, h, n
+    and z are updated together, and all intermediate results are written to preallocated buffers. Results differ from
+    rk_slope() by floating-point rounding only.
+
+    Inputs:
+        state (numpy array): (4 x population shape) array of membrane potentials (mV) and h, n and z gating variables,
+                             updated in place
+
+        app_current (numpy array): Applied current of each neuron (µA)
+
+        syn_current (numpy array): Synaptic current of each neuron (µA)
+
+        g_ks (float or numpy array): m-channel conductance of each neuron (mS)
+
+        timestep (float): Integration time step in ms
+
+        buffers (dict of numpy arrays): Work arrays returned by rk4_buffers() for the population's shape
+    """
+    stage, slope, weighted, total = buffers["stage"], buffers["slope"], buffers["weighted"], buffers["total"]
+    gating, drive, term, factor = buffers["gating"], buffers["drive"], buffers["term"], buffers["factor"]
+    voltage, h_gate, n_gate, z_gate = stage
+
+    np.subtract(app_current, syn_current, out=drive)
+    total[:] = 0
+    np.copyto(stage, state)
+
+    # tau_h and tau_n are computed in units of the time step, so the gating slopes need a single division
+    tau_scales = buffers["gating_scales"] / timestep
+    tau_offset = 0.37 / timestep
+
+    # (weight of the stage in the final update, fraction of its change at which the next stage is evaluated)
+    for stage_weight, next_fraction in ((1, 0.5), (2, 0.5), (2, 1), (1, None)):
+        # m_inf, h_inf, n_inf, z_inf, tau_h and tau_n at the stage's voltage
+        np.multiply(voltage, buffers["gating_slopes"], out=gating)
+        gating += buffers["gating_offsets"]
+        np.exp(gating, out=gating)
+        gating += 1
+        np.reciprocal(gating, out=gating)
+        gating[4:] *= tau_scales
+        gating[4:] += tau_offset
+
+        # Gating variables relax towards their steady state: dt * (x_inf - x) / tau_x
+        np.subtract(gating[1:4], stage[1:4], out=slope[1:4])
+        slope[1:3] /= gating[4:6]
+        slope[3] *= timestep / tau_z
+
+        # Membrane potential: dt * (-I_Na - I_Kd - I_Ks - I_L + I_app - I_syn)
+        np.multiply(gating[0], gating[0], out=term)
+        term *= gating[0]
+        term *= h_gate
+        np.subtract(voltage, E_na, out=factor)
+        term *= factor
+        np.multiply(term, -g_na, out=slope[0])
+        np.square(n_gate, out=term)
+        np.square(term, out=term)
+        term *= g_kd
+        np.multiply(z_gate, g_ks, out=factor)
+        term += factor # Both potassium currents share the reversal potential E_k
+        np.subtract(voltage, E_k, out=factor)
+        term *= factor
+        slope[0] -= term
+        np.subtract(voltage, E_l, out=term)
+        term *= g_l
+        slope[0] -= term
+        slope[0] += drive
+        slope[0] *= timestep
+
+        np.multiply(slope, stage_weight, out=weighted)
+        total += weighted
+
+        if next_fraction is not None:
+            np.multiply(slope, next_fraction, out=stage)
+            stage += state
+
+    total /= 6
+    state += total
+
 def take_closest(myList, myNumber):
     """
     Returns the value in a sorted list that is closest to a given number.
@@ -186,21 +605,327 @@ def take_closest(myList, myNumber):
     else:
         return before
 
+def g_ks_bins_per_ms(g_ks_keys):
+    """
+    Checks that the g_ks values of the F-I curves can be simulated: simulation() needs F-I curves at evenly spaced
+    g_ks values from 0.0 mS (without inhibitory modulation) to 1.5 mS (without current modulation). The spacing may be
+    anything, e.g. 0.005 mS for refined tables.
+
+    Inputs:
+        g_ks_keys (list or numpy array of str): "g_ks_keys" of load_fi_curves()
+
+    Outputs:
+        bins_per_ms (float): Number of F-I curves per mS of g_ks (100.0 for the shipped 0.01 mS grid)
+    """
+    g_ks_values = np.array([float(g_ks_key) for g_ks_key in g_ks_keys])
+    number_of_g_ks_bins = len(g_ks_values)
+
+    if number_of_g_ks_bins < 2 or not np.allclose(g_ks_values, np.linspace(0, 1.5, number_of_g_ks_bins), rtol=0,
+                                                  atol=1e-9):
+        raise ValueError("simulation() needs F-I curves at evenly spaced g_ks values from 0.0 to 1.5 mS, got "
+                         f"{number_of_g_ks_bins} values from {g_ks_keys[0]} to {g_ks_keys[-1]} mS")
+
+    return (number_of_g_ks_bins - 1) / 1.5
+
+def g_ks_bin_indices(g_ks_t, g_ks_keys=None):
+    """
+    Returns the index of the F-I curve g_ks bin used at each simulation step, i.e. of the F-I curve whose g_ks value is
+    closest to g_ks (g_ks rounded to 0.01 mS with the shipped tables).
+
+    Inputs:
+        g_ks_t (numpy array): Time series of g_ks values, at each simulation step
+
+        g_ks_keys (list or numpy array of str, optional): g_ks values of the F-I curves (default is "g_ks_keys" of
+                                                          load_fi_curves()), see g_ks_bins_per_ms()
+
+    Outputs:
+        g_ks_bins (numpy array of ints): Index of the closest F-I curve g_ks value at each step (0 for 0.0 mS to 150
+                                         for 1.5 mS with the shipped tables)
+    """
+    if g_ks_keys is None:
+        g_ks_keys = load_fi_curves()["g_ks_keys"]
+    bins_per_ms = g_ks_bins_per_ms(g_ks_keys)
+
+    # Same as rounding to the grid with np.round(), e.g. np.round(g_ks, 2) * 100 for the 0.01 mS grid
+    g_ks_bins = np.rint(np.asarray(g_ks_t) * bins_per_ms).astype(np.int64)
+
+    if g_ks_bins.size and (g_ks_bins.min() < 0 or g_ks_bins.max() >= len(g_ks_keys)):
+        raise ValueError(f"g_ks values from {np.min(g_ks_t)} to {np.max(g_ks_t)} mS are outside the F-I curves' "
+                         "0.0 to 1.5 mS")
+
+    return g_ks_bins
+
+def applied_current_table(exc_frequencies, inh_current_modifiers, current_modulation, inh_modulation):
+    """
+    Precomputes the applied current of every neuron for each g_ks bin of the F-I curves (151 bins from 0.0 to 1.5 mS
+    in 0.01 mS increments with the shipped tables, see g_ks_bins_per_ms()).
+
+    Inputs:
+        exc_frequencies (numpy array): Selected firing frequency (Hz) of each excitatory neuron
+
+        inh_current_modifiers (numpy array): Random modifier of each inhibitory neuron's applied current
+
+        current_modulation (Boolean): Flag to enable/disable current modulation for all neurons
+
+        inh_modulation (Boolean): Flag to enable/disable inhibitory neuron g_ks modulation
+
+    Outputs:
+        applied_currents (numpy array):
+            (g_ks bins x neurons) array of applied currents in µA. Row b holds the currents used when g_ks is closest
+            to the b-th F-I curve g_ks value (b * 0.01 mS with the shipped tables), see g_ks_bin_indices().
+            Excitatory neurons come first, followed by inhibitory neurons.
+    """
+    fi_data = load_fi_curves()
+    g_ks_bins_per_ms(fi_data["g_ks_keys"]) # Only evenly spaced F-I curves from 0.0 to 1.5 mS can be simulated
+    number_of_g_ks_bins = len(fi_data["g_ks_keys"])
+    number_of_exc_neurons = len(exc_frequencies)
+    applied_currents = np.zeros((number_of_g_ks_bins, number_of_exc_neurons + len(inh_current_modifiers)))
+
+    for g_ks_bin in range(number_of_g_ks_bins):
+        # Without current modulation, currents are those for g_ks = 1.5 mS
+        exc_bin = g_ks_bin if current_modulation else number_of_g_ks_bins - 1
+        frequencies = fi_data["frequencies"][exc_bin, :fi_data["frequency_counts"][exc_bin]]
+
+        # Selects the current of the closest available frequency, preserving the selected firing frequency
+        # Same as take_closest(): if two frequencies are equally close, the smaller one is used
+        position = np.clip(np.searchsorted(frequencies, exc_frequencies), 1, len(frequencies) - 1)
+        closest = np.where(frequencies[position] - exc_frequencies < exc_frequencies - frequencies[position - 1],
+                           position, position - 1)
+        applied_currents[g_ks_bin, :number_of_exc_neurons] = fi_data["currents"][exc_bin, closest]
+
+        # Without inhibitory modulation, currents are those for g_ks = 0 mS
+        if current_modulation and inh_modulation:
+            inh_bin = g_ks_bin
+        elif not current_modulation and inh_modulation:
+            inh_bin = number_of_g_ks_bins - 1
+        else:
+            inh_bin = 0
+        applied_currents[g_ks_bin, number_of_exc_neurons:] = fi_data["inh_currents"][inh_bin] * inh_current_modifiers
+
+    return applied_currents
+
+def fi_curve_frequencies(g_ks_values, currents, t_max=3000, dt=0.01, transient_time=1000, spike_threshold=0,
+                         initial_state=(-42, 0.5, 0.5, 0.2), detect_after_update=False):
+    """
+    Finds the firing frequency of an isolated neuron for every pair of g_ks value and applied current, as in the F-I
+    curve derivation of Figure1.py. All pairs are integrated at once as one array of neuron states, and spikes after
+    the initial transient are counted as they occur instead of being stored.
+
+    By default, spikes are detected as in Figure1.py: the voltage before the update of step i is compared to the
+    threshold, and a spike detected then occurs at time i * dt. With detect_after_update, the voltage after the update
+    is compared instead, as in simulation(), so spikes are detected one step earlier.
+
+    Inputs:
+        g_ks_values (list or numpy array): m-channel conductances (mS)
+
+        currents (list or numpy array): Applied currents (µA)
+
+        t_max (int, optional): Length of each simulation in ms (default is 3000 ms)
+
+        dt (float, optional): Integration time step in ms (default is 0.01 ms)
+
+        transient_time (int, optional): Spikes up to this time in ms are ignored, allowing initial transients to decay
+                                        (default is 1000 ms)
+
+        spike_threshold (int, optional): Threshold voltage in mV above which a spike is recorded (default is 0 mV)
+
+        initial_state (tuple of floats, optional): Initial v (mV), h, n and z of the neuron
+
+        detect_after_update (Boolean, optional): Detect spikes on the voltage after each update, as simulation() does
+                                                 (default is False, detecting on the voltage before it)
+
+    Outputs:
+        frequencies (numpy array): (g_ks values x currents) array of firing frequencies in Hz, the number of spikes
+                                   after transient_time divided by the remaining time
+    """
+    g_ks = np.asarray(g_ks_values, dtype=float)[:, np.newaxis]
+    app_current = np.asarray(currents, dtype=float)[np.newaxis, :]
+    shape = (g_ks.shape[0], app_current.shape[1])
+    steps = int(t_max / dt)
+
+    v, h, n, z = (np.full(shape, float(value)) for value in initial_state)
+    should_record_spike = np.ones(shape, dtype=bool)
+    spike_counts = np.zeros(shape, dtype=np.int64)
+
+    for i in range(1, steps):
+        dh, dn, dz, dv = rk_slope(v, app_current, 0, h, n, z, g_ks, timestep=dt)
+
+        # Spike detection on the voltage before or after this step's update
+        voltage = v + dv if detect_after_update else v
+        spiked = should_record_spike & (voltage > spike_threshold)
+        if dt * i > transient_time:
+            spike_counts += spiked
+        should_record_spike = (should_record_spike & ~spiked) | (voltage < spike_threshold)
+
+        h += dh
+        n += dn
+        z += dz
+        v += dv
+
+    return spike_counts / ((t_max - transient_time) / 1000)
+
+def fi_curve_points(currents, frequencies):
+    """
+    Selects the points of an F-I curve used for plotting and for the F-I curve data. Due to depolarization block,
+    with excess current stimulation, neurons may cease to fire, leading to a sharp dip in the F-I curve. These
+    physiologically unrealistic points are excluded by keeping only nonzero frequencies that exceed the frequency
+    at the previous current.
+
+    Inputs:
+        currents (list or numpy array): Applied currents (µA), in increasing order
+
+        frequencies (list or numpy array): Firing frequency (Hz) at each current, see fi_curve_frequencies()
+
+    Outputs:
+        currents_kept (list of floats): Currents of the selected points
+
+        frequencies_kept (list of floats): Frequencies of the selected points, in increasing order
+    """
+    currents_kept = []
+    frequencies_kept = []
+
+    prev_value = 0
+    for current, frequency in zip(np.asarray(currents).tolist(), np.asarray(frequencies).tolist()):
+        if frequency != 0 and frequency > prev_value:
+            frequencies_kept.append(frequency)
+            currents_kept.append(current)
+        prev_value = frequency
+
+    return currents_kept, frequencies_kept
+
+def generate_fi_curves_json(g_ks_values=np.arange(151) / 100, currents=np.arange(-10, 503) / 20,
+                            json_directory=module_directory, min_frequency=40, max_frequency=60, dt=0.1,
+                            overwrite=False, **fi_kwargs):
+    """
+    Regenerates 'ficurves.json', 'ficurves_keys.json' and 'ficurves_inh.json' (see convert_fi_curves_json()) from
+    F-I curves found with fi_curve_frequencies(). Run convert_fi_curves_json() afterwards to update 'ficurves.npz'.
+
+    For each g_ks value, every frequency of the F-I curve (see fi_curve_points()) strictly between min_frequency and
+    max_frequency is mapped to the lowest current eliciting it. The inhibitory current is the highest current below
+    the lowest current at which the neuron fires, so currents must start below the firing threshold (which is
+    negative for g_ks = 0 mS).
+
+    The shipped tables were derived as simulation() runs neurons, at a 0.1 ms time step and detecting spikes after each
+    update, rather than with the 0.01 ms step and detection of Figure1.py. Both differ by a spike over the 2 s counting
+    window at some currents, as spikes near the window edges move across them. With the defaults, the regenerated
+    tables reproduce the shipped ones except for four frequencies the shipped tables take from currents past the
+    depolarization block (above 15 µA at g_ks = 0.49, 0.99, 1.03 and 1.33 mS), and for the inhibitory currents at
+    g_ks = 0.07, 0.32, 0.61, 0.69 and 1.06 mS, which are one current step apart at the firing threshold.
+
+    simulation() uses the F-I curve of the closest g_ks value, so the g_ks grid can be refined (e.g.
+    np.arange(301) / 200 for 0.005 mS increments) as long as it is evenly spaced from 0.0 to 1.5 mS (see
+    g_ks_bins_per_ms()). The current resolution can be refined freely.
+
+    Inputs:
+        g_ks_values (list or numpy array, optional): m-channel conductances (mS) (default is 0.0 to 1.5 mS in 0.01 mS
+                                                     increments)
+
+        currents (list or numpy array, optional): Applied currents (µA), in increasing order (default is -0.5 to
+                                                  25.1 µA in 0.05 µA increments)
+
+        json_directory (str, optional): Directory the three JSON files are written to (default is this module's
+                                        directory)
+
+        min_frequency, max_frequency (float, optional): Range of frequencies (Hz) stored in the F-I curves (default is
+                                                        40 to 60 Hz)
+
+        dt (float, optional): Integration time step in ms (default is 0.1 ms, as for the shipped tables)
+
+        overwrite (Boolean, optional): Replace existing JSON files in json_directory. Without it, a FileExistsError is
+                                       raised before simulating if any of the three files exists (default is False)
+
+        **fi_kwargs: Additional keyword arguments passed to fi_curve_frequencies() (e.g. t_max)
+
+    Outputs:
+        fi_curves (dict), fi_curves_keys (list of lists), inh_currents (dict): Contents of the three JSON files
+    """
+    file_names = ('ficurves.json', 'ficurves_keys.json', 'ficurves_inh.json')
+    existing_files = [file_name for file_name in file_names if os.path.exists(os.path.join(json_directory, file_name))]
+    if existing_files and not overwrite:
+        raise FileExistsError(f"{', '.join(existing_files)} already exist in {json_directory}, "
+                              "pass overwrite=True to replace them")
+
+    g_ks_values = np.asarray(g_ks_values, dtype=float)
+    currents = np.asarray(currents, dtype=float)
+    frequencies = fi_curve_frequencies(g_ks_values, currents, dt=dt, detect_after_update=True, **fi_kwargs)
+
+    fi_curves = {}
+    fi_curves_keys = []
+    inh_currents = {}
+    for g_ks, g_ks_frequencies in zip(g_ks_values, frequencies):
+        g_ks_key = str(round(float(g_ks), 10))
+
+        # Frequencies of the F-I curve in range, each mapped to the lowest current eliciting it
+        # Points past a depolarization block can repeat lower frequencies, so frequencies are sorted afterwards, as
+        # applied_current_table() requires
+        fi_curve = {}
+        for current, frequency in zip(*fi_curve_points(currents, g_ks_frequencies)):
+            if min_frequency < frequency < max_frequency:
+                fi_curve.setdefault(frequency, current)
+        fi_curves[g_ks_key] = {str(frequency): fi_curve[frequency] for frequency in sorted(fi_curve)}
+        fi_curves_keys.append([float(frequency) for frequency in sorted(fi_curve)])
+
+        firing = np.flatnonzero(g_ks_frequencies)
+        if len(firing) == 0 or firing[0] == 0:
+            raise ValueError(f"Currents do not span the firing threshold at g_ks = {g_ks_key} mS")
+        inh_currents[g_ks_key] = float(currents[firing[0] - 1])
+
+    for file_name, data in zip(file_names, (fi_curves, fi_curves_keys, inh_currents)):
+        with open(os.path.join(json_directory, file_name), 'w') as file:
+            json.dump(data, file)
+
+    return fi_curves, fi_curves_keys, inh_currents
+
 # Look up tables for exponential functions used for synaptic current
 # See equation under Network Structure in Materials and Methods
 tau_r = 0.2 # ms
 tau_d_e = 3 # for excitarory synapses, in ms
 tau_d_i = 5.5 # for inhibitory synapses, in ms
 
-double_exp_list1 = [0] * 5001 # Look up table for excitatory synapses
-for num in range(0, 5001):
-    double_exp_list1[num] = np.exp(-(num * 0.01) / tau_d_e) - np.exp(-(num * 0.01) / tau_r)
+synaptic_kernel_window = 50 # Spikes older than this (in ms) do not contribute to synaptic current
 
-double_exp_list2 = [0] * 5001 # Look up table for inhibitory synapses
-for num in range(0, 5001):
-    double_exp_list2[num] = np.exp(-(num * 0.01) / tau_d_i) - np.exp(-(num * 0.01) / tau_r)
+@functools.lru_cache(maxsize=None)
+def synaptic_kernel_table(timestep, rise_time, decay_time, window=synaptic_kernel_window):
+    """
+    Look up table of the double exponential exp(-t / decay_time) - exp(-t / rise_time) at multiples of the time step.
+    Tables are cached, so each combination of time step and time constants is only computed once.
+
+    Inputs:
+        timestep (float): Integration time step in ms
+
+        rise_time (float): Synaptic rise time constant in ms
 
+        decay_time (float): Synaptic decay time constant in ms
 
+        window (float, optional): Spikes at least this old (in ms) do not contribute (default is 50 ms)
+
+    Outputs:
+        table (numpy array): Read-only array indexed by the number of steps since a spike. The final entry is 0, and
+                             lags beyond the window should be clipped to it.
+    """
+    window_steps = int(np.ceil(window / timestep)) # First lag outside the window
+    lags = np.arange(window_steps + 1)
+    table = np.exp(-(lags * timestep) / decay_time) - np.exp(-(lags * timestep) / rise_time)
+    table[window_steps] = 0
+    table.flags.writeable = False
+
+    return table
+
+double_exp_list1 = synaptic_kernel_table(0.01, tau_r, tau_d_e) # Look up table for excitatory synapses at 0.01 ms
+double_exp_list2 = synaptic_kernel_table(0.01, tau_r, tau_d_i) # Look up table for inhibitory synapses at 0.01 ms
+
+# Accuracy of the exponential trace kernel (synaptic_kernel="trace" in simulation()) relative to the look up tables.
+# Both evaluate the double exponential exactly at multiples of dt; the look up tables additionally drop spikes
+# at least 50 ms old. At dt = 0.1 ms:
+#   - Kernel peak: 0.769 (excitatory), 0.850 (inhibitory)
+#   - Kernel value at 50 ms, the largest per-spike difference: 5.8e-8 (excitatory), 1.1e-4 (inhibitory)
+#   - Fraction of the kernel's area beyond 50 ms: 6.3e-8 (excitatory), 1.2e-4 (inhibitory)
+#   - Largest difference in i_hyp for a neuron firing regularly at 50 Hz:
+#     5.8e-8 (excitatory), 1.2e-4 (inhibitory), i.e. 7.5e-8 and 1.3e-4 of the peak i_hyp
+# At the network level, a 400 ms run of the inter-connectivity dominated network (same random seed) produced
+# 15782 vs 15783 excitatory and 3480 vs 3480 inhibitory spikes with the "table" and "trace" kernels respectively
+# Before the tables were computed at dt, they were sampled at 0.01 ms and indexed with int(round(time_difference, 2) * 100),
+# which occasionally selected the previous 0.01 ms sample (per-spike differences of up to 1.6e-3).
 
 def record_spike(voltage, spike_threshold, step,
                            should_record_spike, neuron_list, timestep = 0.1):
@@ -235,10 +960,389 @@ def record_spike(voltage, spike_threshold, step,
 
     return should_record_spike
 
+def record_spikes(voltages, spike_threshold, step, should_record_spike, spike_lists):
+    """
+    Array version of record_spike(). Records spikes for a whole population of neurons at once.
+    Spikes are stored as integer step numbers; multiply by the time step to obtain spike times in ms.
+
+    Inputs:
+        voltages (numpy array): Membrane potentials of all neurons at a given time (mV)
+
+        spike_threshold (int): Threshold voltage in mV above which a spike is recorded
+
+        step (int): Simulation time step
+
+        should_record_spike (numpy array of Booleans): Flags indicating which neurons can currently record a spike.
+                                                       Modified in place.
+
+        spike_lists (list of lists of ints): Spike steps of each neuron, in the same order as voltages
+
+    Outputs:
+        spiked (numpy array of Booleans): Flags indicating which neurons spiked at this step
+    """
+    spiked = should_record_spike & (voltages > spike_threshold)
+    rearmed = ~should_record_spike & (voltages < spike_threshold)
+
+    for neuron_no in np.flatnonzero(spiked):
+        spike_lists[neuron_no].append(step) # Record spike
+
+    should_record_spike[spiked] = False # Wait until voltage goes below spike threshold before detecting next spike
+    should_record_spike[rearmed] = True # Reset flag if neuron voltage falls below spike threshold
+
+    return spiked
+
+empty_spike_slot = -10 ** 9 # Step stored in unused slots of the recent spike buffers, far outside the kernel window
+
+def store_recent_spikes(spike_buffer, spike_buffer_position, spiked_neurons, step, window_steps):
+    """
+    Stores the step of a new spike in the circular buffer of recent spikes of each neuron that spiked.
+    The buffer is enlarged if the slot to be overwritten still holds a spike inside the synaptic kernel window.
+
+    Inputs:
+        spike_buffer (numpy array of ints): (neurons x capacity) array of recent spike steps of each neuron
+
+        spike_buffer_position (numpy array of ints): Next slot to write to in each neuron's row. Modified in place.
+
+        spiked_neurons (numpy array of ints): Indices of neurons that spiked at this step
+
+        step (int): Simulation time step
+
+        window_steps (int): Length of the synaptic kernel window in steps
+
+    Outputs:
+        spike_buffer (numpy array of ints): Updated buffer (a new, larger array if the buffer had to grow)
+    """
+    slots = spike_buffer_position[spiked_neurons]
+
+    # Grow the buffer while a spike still needed at the next step would be overwritten
+    while np.any(step + 1 - spike_buffer[spiked_neurons, slots] < window_steps):
+        capacity = spike_buffer.shape[1]
+        spike_buffer = np.concatenate((spike_buffer, np.full_like(spike_buffer, empty_spike_slot)), axis=1)
+        slots = np.where(step + 1 - spike_buffer[spiked_neurons, slots] < window_steps, capacity, slots)
+
+    spike_buffer[spiked_neurons, slots] = step
+    spike_buffer_position[spiked_neurons] = (slots + 1) % spike_buffer.shape[1]
+
+    return spike_buffer
+
+def network_step(step, previous, current, v, h, n, z, app_current, i_syn, g_ks, kernel_rows, i_hyp, timestep,
+                 spike_threshold, should_record_spike, spiked, unstored, use_trace, trace_d, trace_r, trace_d_decay,
+                 trace_r_decay, spike_buffer, spike_buffer_position, kernel_by_lag, kernel_window_steps):
+    """
+    Advances all neurons by one step in a single loop: RK4 step, spike detection and the synaptic kernel sum ('i_hyp')
+    of the next step. Used, compiled with Numba, by the "numba" engine of simulation(); see compiled_network_step().
+    Arrays are modified in place.
+
+    Inputs:
+        step (int): Simulation time step
+
+        previous, current (ints): Columns of v, h, n and z holding the previous and updated state
+
+        v, h, n, z (numpy arrays): (neurons x 5) state histories, as in simulation()
+
+        app_current (numpy array): Applied current of each neuron (µA)
+
+        i_syn (numpy array): Synaptic current of each neuron (µA)
+
+        g_ks (numpy array): m-channel conductance of each neuron (mS)
+
+        kernel_rows (numpy array of ints): Row of kernel_by_lag used by each neuron (0 excitatory, 1 inhibitory)
+
+        i_hyp (numpy array): Synaptic kernel sum of each neuron, replaced by the sum for the next step
+
+        timestep (float): Integration time step in ms
+
+        spike_threshold (float): Threshold voltage in mV above which a spike is recorded
+
+        should_record_spike (numpy array of Booleans): Spike detection flags, as in record_spikes()
+
+        spiked (numpy array of Booleans): Flags of neurons that spiked at this step (output)
+
+        unstored (numpy array of Booleans): Flags of spikes that did not fit in the recent spike buffer (output)
+
+        use_trace (Boolean): Use the exponential traces instead of the recent spike buffer for 'i_hyp'
+
+        trace_d, trace_r (numpy arrays): Exponential traces of the "trace" synaptic kernel
+
+        trace_d_decay (numpy array), trace_r_decay (float): Per-step decay factors of the traces
+
+        spike_buffer, spike_buffer_position (numpy arrays): Recent spike buffers, see store_recent_spikes()
+
+        kernel_by_lag (numpy array): (2 x lags) excitatory and inhibitory look up tables, see synaptic_kernel_table()
+
+        kernel_window_steps (int): Final, zero, lag of the look up tables
+
+    Outputs:
+        unstored_count (int): Number of spikes that did not fit in the recent spike buffer. These must be stored with
+                              store_recent_spikes(), and their contribution added to i_hyp.
+    """
+    number_of_neurons = v.shape[0]
+    capacity = spike_buffer.shape[1]
+    next_kernel_on = timestep * (step + 1) > 100 # Synaptic currents are off for the first 100 ms
+    unstored_count = 0
+
+    for neuron_no in range(number_of_neurons):
+        # Runge-Kutta step
+        dh, dn, dz, dv = rk_slope(v[neuron_no, previous], app_current[neuron_no], i_syn[neuron_no],
+                                  h[neuron_no, previous], n[neuron_no, previous], z[neuron_no, previous],
+                                  g_ks[neuron_no], timestep)
+        h[neuron_no, current] = h[neuron_no, previous] + dh
+        n[neuron_no, current] = n[neuron_no, previous] + dn
+        z[neuron_no, current] = z[neuron_no, previous] + dz
+        v[neuron_no, current] = v[neuron_no, previous] + dv
+
+        # Spike detection, as in record_spike()
+        spiked[neuron_no] = False
+        unstored[neuron_no] = False
+        if should_record_spike[neuron_no]:
+            if v[neuron_no, current] > spike_threshold:
+                spiked[neuron_no] = True
+                should_record_spike[neuron_no] = False
+        elif v[neuron_no, current] < spike_threshold:
+            should_record_spike[neuron_no] = True
+
+        # Synaptic kernel sum for the next step
+        if use_trace:
+            if spiked[neuron_no]:
+                trace_d[neuron_no] += 1
+                trace_r[neuron_no] += 1
+            trace_d[neuron_no] *= trace_d_decay[neuron_no]
+            trace_r[neuron_no] *= trace_r_decay
+            i_hyp[neuron_no] = trace_d[neuron_no] - trace_r[neuron_no] if next_kernel_on else 0.0
+        else:
+            if spiked[neuron_no]:
+                slot = spike_buffer_position[neuron_no]
+                if step + 1 - spike_buffer[neuron_no, slot] < kernel_window_steps:
+                    unstored[neuron_no] = True # The buffer must grow, see store_recent_spikes()
+                    unstored_count += 1
+                else:
+                    spike_buffer[neuron_no, slot] = step
+                    spike_buffer_position[neuron_no] = (slot + 1) % capacity
+
+            kernel_sum = 0.0
+            if next_kernel_on:
+                for slot in range(capacity):
+                    lag = min(step + 1 - spike_buffer[neuron_no, slot], kernel_window_steps)
+                    kernel_sum += kernel_by_lag[kernel_rows[neuron_no], lag]
+            i_hyp[neuron_no] = kernel_sum
+
+    return unstored_count
+
+_compiled_network_step = None # Numba-compiled network_step(), see compiled_network_step()
+
+def compiled_network_step():
+    """
+    Compiles network_step() with Numba on first use. Compiled code is cached on disk, so later processes
+    (e.g. sweep workers) load it instead of compiling again.
+
+    Outputs:
+        network_step (numba dispatcher): Compiled network_step()
+    """
+    global _compiled_network_step
+
+    if _compiled_network_step is None:
+        numba = import_numba()
+
+        # Functions are compiled from their own code, with the functions they call resolved to compiled versions
+        def compile_function(function, compiled_globals):
+            return numba.njit(cache=True)(types.FunctionType(
+                function.__code__, compiled_globals, function.__name__, function.__defaults__
+            ))
+
+        compiled_globals = dict(globals())
+        for gating_function in (m_inf, h_inf, n_inf, z_inf, tau_h, tau_n):
+            compiled_globals[gating_function.__name__] = numba.njit(cache=True)(gating_function)
+        compiled_globals["rk_slope"] = compile_function(rk_slope, compiled_globals)
+        _compiled_network_step = compile_function(network_step, compiled_globals)
+
+    return _compiled_network_step
+
+def draw_neuron_parameters(number_of_neurons, number_of_exc_neurons, tracked_neuron, rng=None):
+    """
+    Draws the random parameters of each neuron, in the order used by simulation().
+
+    Inputs:
+        number_of_neurons (int): Total number of neurons in the network
+
+        number_of_exc_neurons (int): Number of excitatory neurons
+
+        tracked_neuron (int): Index of the excitatory neuron set to fire at 50 Hz
+
+        rng (numpy.random.Generator, optional): Random number generator used for the draws. NumPy's global random
+                                                state is used if not given.
+
+    Outputs:
+        exc_frequencies (numpy array): Selected firing frequency of each excitatory neuron in Hz
+
+        inh_current_modifiers (numpy array): Random modifier of each inhibitory neuron's applied current
+
+        initial_conditions (numpy array): (neurons x 4) initial v (mV), h, z and n of each neuron
+    """
+    random_state = np.random if rng is None else rng
+
+    # Excitatory neurons are selected to fire at a frequency randomly between 45 and 55Hz
+    exc_frequencies = random_state.uniform(45, 55, number_of_exc_neurons)
+
+    # Set a single excitatory neuron (402 by default) firing frequency to 50Hz to track its applied current over time
+    exc_frequencies[tracked_neuron] = 50
+
+    # Inhibitory neurons have applied current set slightly below threshold current required to fire, mulitplied by a random modifier
+    inh_current_modifiers = random_state.uniform(0.90476, 1, number_of_neurons - number_of_exc_neurons)
+
+    # Random initial conditions for all neurons, drawn neuron by neuron
+    initial_conditions = random_state.uniform([-62, 0.2, 0.15, 0.2], [-22, 0.8, 0.25, 0.8], (number_of_neurons, 4))
+
+    return exc_frequencies, inh_current_modifiers, initial_conditions
+
+def spike_data(spike_steps, timestep, exc_frequencies, inh_current_modifiers):
+    """
+    Converts recorded spike steps into the per-neuron dictionaries returned by simulation().
+
+    Inputs:
+        spike_steps (list of lists of ints): Spike steps of each neuron, excitatory neurons first
+
+        timestep (float): Integration time step in ms
+
+        exc_frequencies (numpy array): Selected firing frequency of each excitatory neuron in Hz
+
+        inh_current_modifiers (numpy array): Random modifier of each inhibitory neuron's applied current
+
+    Outputs:
+        neuron_list_exc_sorted (dict of dicts): Excitatory neurons sorted by firing frequency, see simulation()
+
+        neuron_list_inh (dict of dicts): Inhibitory neurons, see simulation()
+    """
+    number_of_exc_neurons = len(exc_frequencies)
+
+    # Data related to each excitatory neuron - current, spike times, selected firing frequency
+    neuron_list_exc = {
+        neuron: {"current": 0, "spike times": [timestep * step for step in spike_steps[neuron]],
+                 "frequency": exc_frequencies[neuron]}
+        for neuron in range(number_of_exc_neurons)
+    }
+
+    # Data related to each inhibitory neuron - current, spike times, selected random value to modify current
+    neuron_list_inh = {
+        neuron: {"current": 0, "spike times": [timestep * step for step in spike_steps[number_of_exc_neurons + neuron]],
+                 "current random seed": inh_current_modifiers[neuron]}
+        for neuron in range(len(inh_current_modifiers))
+    }
+
+    # Sort excitatory neuron spike lists by firing frequency for raster plots
+    neuron_list_exc_sort_order = sorted(
+        neuron_list_exc.items(),
+        key=lambda item: item[1]["frequency"],
+        reverse=True
+    )
+    neuron_list_exc_sorted = {
+        i: neuron_data for i, (original_index, neuron_data) in enumerate(neuron_list_exc_sort_order)
+    }
+
+    return neuron_list_exc_sorted, neuron_list_inh
+
+def spike_trains(spike_steps, timestep, exc_frequencies, inh_current_modifiers):
+    """
+    Converts recorded spike steps into the SpikeTrains returned by simulation() with spike_format="arrays".
+
+    Inputs:
+        spike_steps (list of lists of ints): Spike steps of each neuron, excitatory neurons first
+
+        timestep (float): Integration time step in ms
+
+        exc_frequencies (numpy array): Selected firing frequency of each excitatory neuron in Hz
+
+        inh_current_modifiers (numpy array): Random modifier of each inhibitory neuron's applied current
+
+    Outputs:
+        spike_trains_exc_sorted (SpikeTrains): Excitatory neurons, presented sorted by firing frequency as in spike_data()
+
+        spike_trains_inh (SpikeTrains): Inhibitory neurons
+    """
+    number_of_exc_neurons = len(exc_frequencies)
+
+    # Stable sort by decreasing frequency, the order of spike_data()
+    exc_sort_order = np.argsort(-np.asarray(exc_frequencies), kind='stable')
+
+    spike_trains_exc_sorted = SpikeTrains.from_step_lists(spike_steps[:number_of_exc_neurons], timestep,
+                                                          order=exc_sort_order, values=exc_frequencies,
+                                                          value_name="frequency")
+    spike_trains_inh = SpikeTrains.from_step_lists(spike_steps[number_of_exc_neurons:], timestep,
+                                                   values=inh_current_modifiers, value_name="current random seed")
+
+    return spike_trains_exc_sorted, spike_trains_inh
+
+def save_checkpoint(checkpoint, path):
+    """
+    Writes a checkpoint returned by simulation() to a compressed .npz file, e.g. to resume it in other processes.
+
+    Inputs:
+        checkpoint (dict): Simulation state, see the checkpoint_time argument of simulation()
+
+        path (str): Path of the file to write
+    """
+    arrays = {name: value for name, value in checkpoint.items() if name not in ("g_syn", "spike_steps", "rng_state")}
+
+    # Sparse connectivity is stored as its CSR arrays
+    g_syn = checkpoint["g_syn"]
+    if hasattr(g_syn, "tocsr"): # SciPy sparse matrix
+        g_syn = g_syn.tocsr()
+        arrays.update(g_syn_data=g_syn.data, g_syn_indices=g_syn.indices, g_syn_indptr=g_syn.indptr,
+                      g_syn_shape=np.array(g_syn.shape))
+    else:
+        arrays["g_syn"] = g_syn
+
+    # Spike steps of all neurons are stored one after the other
+    arrays["spike_steps"] = np.array([step for neuron_spike_steps in checkpoint["spike_steps"]
+                                      for step in neuron_spike_steps], dtype=np.int64)
+    arrays["spike_counts"] = np.array([len(neuron_spike_steps) for neuron_spike_steps in checkpoint["spike_steps"]])
+    arrays["rng_state"] = json.dumps(checkpoint["rng_state"])
+
+    np.savez_compressed(path, **arrays)
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint().
+
+    Inputs:
+        path (str): Path of the file to read
+
+    Outputs:
+        checkpoint (dict): Simulation state, to pass as the resume_from argument of simulation()
+    """
+    with np.load(path) as file:
+        data = {key: file[key] for key in file.files}
+
+    checkpoint = {name: value for name, value in data.items() if not name.startswith(("g_syn_", "spike_"))}
+    for name in ("step", "tracked_neuron"):
+        checkpoint[name] = int(data[name])
+    checkpoint["dt"] = float(data["dt"])
+    for name in ("engine", "synaptic_kernel"):
+        checkpoint[name] = str(data[name])
+    checkpoint["keep_spikes"] = bool(data["keep_spikes"])
+    checkpoint["exc_currs"] = data["exc_currs"].tolist()
+    checkpoint["rng_state"] = json.loads(str(data["rng_state"]))
+
+    if "g_syn_data" in data:
+        if import_sparse() is None:
+            raise ImportError("Checkpoint has sparse connectivity, which requires SciPy")
+        checkpoint["g_syn"] = sparse.csr_matrix((data["g_syn_data"], data["g_syn_indices"], data["g_syn_indptr"]),
+                                                shape=tuple(data["g_syn_shape"]))
+
+    checkpoint["spike_buffer"] = data["spike_buffer"]
+    checkpoint["spike_buffer_position"] = data["spike_buffer_position"]
+    checkpoint["spike_steps"] = [neuron_spike_steps.tolist() for neuron_spike_steps in
+                                 np.split(data["spike_steps"], np.cumsum(data["spike_counts"])[:-1])]
+
+    return checkpoint
+
 def simulation(EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength,
-               EE_connectivity_strength, current_modulation, inh_modulation, t_max, dt = 0.1, static_g_ks=None, g_ks_zero_time=None):
+               EE_connectivity_strength, current_modulation, inh_modulation, t_max, dt = 0.1, static_g_ks=None, g_ks_zero_time=None,
+               engine="loop", synaptic_kernel="table", connectivity="auto", g_syn=None,
+               number_of_neurons=1000, number_of_exc_neurons=800, tracked_neuron=402, applied_currents=None,
+               tau_r=tau_r, tau_d_e=tau_d_e, tau_d_i=tau_d_i, seed=None, checkpoint_time=None, resume_from=None,
+               spike_format="dict", synchrony_monitor=None, keep_spikes=True):
     """
-    This function sets up a network with 800 excitatory and 200 inhibitory neurons,
+    This function sets up a network with 800 excitatory and 200 inhibitory neurons (by default),
     using the equations specified under Neuron Model in Materials and Methods.
     Numerical solution is calculated over the specified time period.
     Cholinergic modulation is introduced through g_ks linear decline. By default, g_ks is set to reach 0 mS at t_max.
@@ -266,16 +1370,97 @@ def simulation(EI_connectivity_strength, IE_connectivity_strength, II_connectivi
 
         g_ks_zero_time (int, optional): Time in ms when g_ks should reach 0. Must be greater than 1000 ms and lower than t_max
 
+        engine (str, optional): Integration engine used to advance the neurons at each step.
+            - "loop" (default): calls rk_slope() once per neuron, as in the original implementation.
+            - "vectorized": advances v/h/n/z of all excitatory and inhibitory cells in a single array-wide
+              RK4 step (see rk4_population_step()). At 1000 neurons it is 55x faster than "loop" over 150 ms
+              (1.2 s against 66 s) but 38x over 1300 ms (16 s against 607 s): once spikes arrive after 100 ms,
+              each step is bound by the RK4 step and the dense synaptic matrix-vector products (about 1 ms).
+              np.exp rounds differently on arrays than on scalars, so the RK4 step differs by up to ~2e-14 mV per
+              step and spike times eventually drift apart: rasters are statistically equivalent to those of "loop",
+              not identical.
+            - "numba": advances the network with network_step() compiled by Numba, fusing the RK4 step, spike
+              detection and synaptic kernel sum into one loop over neurons, about 80x faster than "loop" (200
+              neurons, 1300 ms, excluding the one-time compilation). Sums in a different order than "vectorized",
+              so rasters are statistically equivalent rather than identical over long runs.
+              Falls back to "vectorized" with a warning when Numba is not installed.
+
+        synaptic_kernel (str, optional): Method used to compute 'i_hyp', the spike-driven component of synaptic current.
+            - "table" (default): sums look up tables of the kernel (see synaptic_kernel_table()) over every spike of the
+              last 50 ms. Recent spikes are kept in a fixed-size circular buffer per neuron, so the sum is a single
+              gather from the tables regardless of simulation length.
+            - "trace": each neuron carries two exponentially decaying traces (one per exponential of the kernel), which are
+              incremented when it spikes and decayed every step. Work per step no longer grows with simulation length.
+              Differences from "table" are at most ~1e-4 per spike (see the accuracy comparison below the look up tables).
+
+        connectivity (str, optional): Storage used for the connectivity matrix in the synaptic current calculation.
+            - "dense": NumPy arrays
+            - "sparse": SciPy CSR matrices, which only store existing synapses (requires SciPy)
+            - "auto" (default): sparse when SciPy is available and either at most sparse_connectivity_density of the
+              possible synapses exist (from the synaptic weights, or from g_syn or the checkpoint when given), or the
+              dense matrix would exceed sparse_connectivity_memory bytes and CSR storage is smaller. Dense otherwise,
+              which includes networks of the default size with all four connection types.
+
+        g_syn (numpy array or scipy sparse matrix, optional): Connectivity matrix returned by build_connectivity() to
+            reuse instead of drawing a new network. The four synaptic weight arguments are then ignored.
+
+        number_of_neurons (int, optional): Total number of neurons in the network (default is 1000)
+
+        number_of_exc_neurons (int, optional): Number of excitatory neurons (default is 800). The remaining
+                                               neurons are inhibitory.
+
+        tracked_neuron (int, optional): Index of the excitatory neuron, set to fire at 50 Hz, whose applied current
+                                        is returned in exc_currs (default is 402)
+
+        applied_currents (numpy array, optional): (g_ks bins x neurons) table of applied currents for each F-I curve
+            g_ks value, as returned by applied_current_table(), to use instead of the currents derived from the F-I
+            curves and the randomly selected firing frequencies.
+
+        tau_r (float, optional): Synaptic rise time constant in ms (default is 0.2 ms)
+
+        tau_d_e (float, optional): Decay time constant of excitatory synapses in ms (default is 3 ms)
+
+        tau_d_i (float, optional): Decay time constant of inhibitory synapses in ms (default is 5.5 ms)
+
+        seed (int, numpy SeedSequence or numpy Generator, optional): Source of every random draw (connectivity, firing
+            frequencies, inhibitory current modifiers and initial conditions), passed to numpy.random.default_rng().
+            If not given, draws come from NumPy's global random state, so np.random.seed() still fixes the results.
+
+        checkpoint_time (float, optional): Time in ms at which to take a snapshot of the complete simulation state,
+            returned as a fifth output. Must be lower than t_max.
+
+        resume_from (dict, optional): Checkpoint returned by an earlier simulation() or load_checkpoint() to continue
+            from, skipping the steps up to the checkpoint. Connectivity, neuron parameters, neuron states and spikes
+            are taken from the checkpoint, so the four synaptic weight arguments, g_syn, the network size arguments and
+            seed are ignored. g_ks follows this call's t_max, static_g_ks and g_ks_zero_time after the checkpoint,
+            which gives forks with different g_ks schedules or lengths from a single warm-up. The outputs cover the
+            whole simulation, including the steps before the checkpoint. dt and synaptic_kernel must match the
+            checkpoint, and the numba engine cannot resume checkpoints of the other engines (or the reverse), as it
+            keeps its synaptic state one step ahead. The checkpoint is not modified, so it can be resumed many times.
+
+        spike_format (str, optional): Format of the spike outputs.
+            - "dict" (default): dictionaries with a list of spike times per neuron, described below
+            - "arrays": Spike_funcs.SpikeTrains holding the spike steps of all neurons in flat arrays, which is faster
+              to build and much smaller for long simulations. SpikeTrains.to_dict() converts to the dictionaries.
+
+        synchrony_monitor (Measure_funcs.OnlineSynchrony, optional): Measures Golomb synchrony bin by bin during the
+            simulation, as synch_array_generator() does afterwards. Results are read from the monitor after the run.
+            When resuming, the checkpoint's spikes are replayed to the monitor first, so checkpoints taken with
+            keep_spikes=False cannot be resumed with a monitor.
+
+        keep_spikes (Boolean, optional): Keep the spike times of the whole simulation (default is True). If False, the
+            spike outputs (and checkpoints) hold no spikes, e.g. for long runs measured with a synchrony_monitor.
+
     Outputs:
         neuron_list_exc_sorted (dict of dicts):
             Nested dictionary containing excitatory neurons sorted by firing frequency.
-            - 800 string keys ("0" to "799")
+            - 800 string keys ("0" to "799") by default, one per excitatory neuron
             - Each key maps to a dictionary with:
                 - "spike times": List of floats representing spike times in ms in chronological order.
 
         neuron_list_inh (dict of dicts):
             Nested dictionary containing inhibitory neurons sorted by firing frequency.
-            - 200 string keys ("0" to "199")
+            - 200 string keys ("0" to "199") by default, one per inhibitory neuron
             - Each key maps to a dictionary with:
                 - "spike times": List of floats representing spike times in ms in chronological order.
 
@@ -283,86 +1468,107 @@ def simulation(EI_connectivity_strength, IE_connectivity_strength, II_connectivi
             Applied current in µA to an excitatory neuron with average firing frequency at each simulation step.
 
         g_ks_t (numpy array): Time series of g_ks values, at each simulation step.
+
+        checkpoint (dict): Only returned if checkpoint_time is given. Snapshot of the simulation state at the end of
+            the step at checkpoint_time, to pass as resume_from or to save_checkpoint().
     """
 
-    # Total number of steps in simulation
-    steps = int(t_max / dt)
+    if engine not in ("loop", "vectorized", "numba"):
+        raise ValueError(f"Unknown engine '{engine}', expected 'loop', 'vectorized' or 'numba'")
 
-    #Computing g_ks_t
-    g_ks_t = create_g_ks_t(t_max, timestep=dt) # Sets rate of g_ks linear decline such that g_ks reaches 0 at t_max
+    if engine == "numba" and import_numba() is None:
+        warnings.warn("Numba is not installed, using the vectorized engine instead")
+        engine = "vectorized"
 
-    if g_ks_zero_time !=None:
-        g_ks_t = create_g_ks_t(t_max, timestep=dt, g_ks_zero_time=g_ks_zero_time)
+    if synaptic_kernel not in ("table", "trace"):
+        raise ValueError(f"Unknown synaptic_kernel '{synaptic_kernel}', expected 'table' or 'trace'")
 
-    if static_g_ks != None:
-        g_ks_t = np.ones(steps) * static_g_ks
+    if connectivity not in ("auto", "dense", "sparse"):
+        raise ValueError(f"Unknown connectivity '{connectivity}', expected 'auto', 'dense' or 'sparse'")
 
-    # Generate Neurons
-    number_of_neurons = 1000
-    number_of_exc_neurons = 800  # 200 inhibitory cells
+    if connectivity == "sparse" and import_sparse() is None:
+        raise ImportError("connectivity='sparse' requires SciPy")
 
-    # Initialize data related to each excitatory neuron - current, spike times, selected firing frequency
-    neuron_list_exc = {
-        neuron: {"current": 0, "spike times": [], "frequency": 0}
-        for neuron in range(number_of_exc_neurons)
-    }
+    if spike_format not in ("dict", "arrays"):
+        raise ValueError(f"Unknown spike_format '{spike_format}', expected 'dict' or 'arrays'")
 
-    # Initialize data related to each inhibitory neuron - current, spike times, selected random value to modify current
-    neuron_list_inh = {
-        neuron: {"current": 0, "spike times": [], "current random seed": 0}
-        for neuron in range(number_of_neurons - number_of_exc_neurons)
-    }
+    # A resumed simulation continues the checkpoint's network
+    if resume_from is not None:
+        if resume_from["dt"] != dt:
+            raise ValueError(f"Checkpoint was taken with dt = {resume_from['dt']} ms, not {dt} ms")
+        if resume_from["synaptic_kernel"] != synaptic_kernel:
+            raise ValueError(f"Checkpoint was taken with synaptic_kernel '{resume_from['synaptic_kernel']}'")
+        if (resume_from["engine"] == "numba") != (engine == "numba"):
+            raise ValueError(f"Checkpoint taken with the '{resume_from['engine']}' engine cannot be resumed with the "
+                             f"'{engine}' engine")
+        if synchrony_monitor is not None and not resume_from["keep_spikes"]:
+            raise ValueError("Checkpoint was taken with keep_spikes=False, so a synchrony_monitor cannot measure the "
+                             "bins before it")
 
-    # Initialize connectivity matrix
-    g_syn = np.zeros((number_of_neurons, number_of_neurons))
+        number_of_neurons = resume_from["v"].shape[0]
+        number_of_exc_neurons = len(resume_from["exc_frequencies"])
+        tracked_neuron = resume_from["tracked_neuron"]
 
-    # Create EE connections (excitatory to excitatory)
-    for index in np.ndindex((number_of_exc_neurons, number_of_exc_neurons)):
-        probability_of_synapse = 0.3
-        g_syn[index] = np.random.choice(
-            [EE_connectivity_strength, 0],
-            p=[probability_of_synapse, 1 - probability_of_synapse]
-        )
-        if index[0] == index[1]:  # No self-synapses
-            g_syn[index] = 0
-
-    # Create IE connections (inhibitory to excitatory)
-    for index in np.ndindex((number_of_exc_neurons, number_of_neurons - number_of_exc_neurons)):
-        probability_of_synapse = 0.5
-        g_syn[index[0], index[1] + number_of_exc_neurons] = np.random.choice(
-            [IE_connectivity_strength, 0],
-            p=[probability_of_synapse, 1 - probability_of_synapse]
-        )
+    if not 0 <= tracked_neuron < number_of_exc_neurons < number_of_neurons:
+        raise ValueError("Expected 0 <= tracked_neuron < number_of_exc_neurons < number_of_neurons")
 
-    # Create EI connections (excitatory to inhibitory)
-    for index in np.ndindex((number_of_neurons - number_of_exc_neurons, number_of_exc_neurons)):
-        probability_of_synapse = 0.5
-        g_syn[index[0] + number_of_exc_neurons, index[1]] = np.random.choice(
-            [EI_connectivity_strength, 0],
-            p=[probability_of_synapse, 1 - probability_of_synapse]
-        )
+    # Total number of steps in simulation
+    steps = int(t_max / dt)
 
-    # Create II Connections (inhibitory to inhibitory)
-    for index in np.ndindex((number_of_neurons - number_of_exc_neurons, number_of_neurons - number_of_exc_neurons)):
-        probability_of_synapse = 0.3
-        g_syn[index[0] + number_of_exc_neurons, index[1] + number_of_exc_neurons] = np.random.choice(
-            [II_connectivity_strength, 0],
-            p=[probability_of_synapse, 1 - probability_of_synapse]
-        )
-        if index[0] == index[1]:  # No self-synapses
-            g_syn[index[0] + number_of_exc_neurons, index[1] + number_of_exc_neurons] = 0
+    # Steps completed before the checkpoint is taken, and before the first step of a resumed simulation
+    checkpoint_step = None if checkpoint_time is None else int(checkpoint_time / dt)
+    if checkpoint_step is not None and not 0 <= checkpoint_step < steps - 1:
+        raise ValueError("checkpoint_time must be between 0 and t_max")
 
-    # Set Applied Current
-    # Excitatory neurons are selected to fire at a frequency randomly between 45 and 55Hz
-    for neuron_no in range(number_of_exc_neurons):
-        neuron_list_exc[neuron_no]["frequency"] = np.random.uniform(45, 55)
+    start_step = 1 if resume_from is None else resume_from["step"] + 1
+    if start_step > steps:
+        raise ValueError("Checkpoint is later than t_max")
+
+    #Computing g_ks_t
+    if static_g_ks != None:
+        g_ks_t = np.ones(steps) * static_g_ks
+    elif g_ks_zero_time !=None:
+        g_ks_t = create_g_ks_t(t_max, timestep=dt, g_ks_zero_time=g_ks_zero_time)
+    else:
+        g_ks_t = create_g_ks_t(t_max, timestep=dt) # Sets rate of g_ks linear decline such that g_ks reaches 0 at t_max
+
+    # Connectivity storage
+    if connectivity == "auto":
+        if resume_from is not None:
+            density = connection_density(resume_from["g_syn"])
+        elif g_syn is not None:
+            density = connection_density(g_syn)
+        else:
+            density = expected_connection_density(
+                EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength, EE_connectivity_strength,
+                number_of_exc_neurons, number_of_neurons - number_of_exc_neurons
+            )
+        use_sparse = use_sparse_connectivity(density, number_of_neurons)
+    else:
+        use_sparse = connectivity == "sparse"
 
-    # Set a single excitatory neuron (402) firing frequency to 50Hz to track its applied current over time
-    neuron_list_exc[402]["frequency"] = 50
+    # Random number generator of every draw. Without a seed, the connectivity Generator is seeded from NumPy's global
+    # random state and the other draws use it directly, so that np.random.seed() still fixes the results
+    rng = None if seed is None else np.random.default_rng(seed)
 
-    # Inhibitory neurons have applied current set slightly below threshold current required to fire, mulitplied by a random modifier
-    for neuron_no in range(number_of_neurons - number_of_exc_neurons):
-        neuron_list_inh[neuron_no]["current random seed"] = np.random.uniform(0.90476, 1) #Random modifier
+    if resume_from is not None:
+        # Nothing is drawn when resuming
+        g_syn = resume_from["g_syn"]
+        exc_frequencies = resume_from["exc_frequencies"]
+        inh_current_modifiers = resume_from["inh_current_modifiers"]
+    else:
+        # Initialize connectivity matrix
+        if g_syn is None:
+            g_syn = build_connectivity(
+                EI_connectivity_strength, IE_connectivity_strength, II_connectivity_strength, EE_connectivity_strength,
+                number_of_exc_neurons, number_of_neurons - number_of_exc_neurons,
+                rng=np.random.default_rng(np.random.randint(2 ** 32)) if rng is None else rng, sparse_output=use_sparse
+            )
+
+        # Firing frequencies, inhibitory current modifiers and initial conditions
+        exc_frequencies, inh_current_modifiers, initial_conditions = draw_neuron_parameters(
+            number_of_neurons, number_of_exc_neurons, tracked_neuron, rng=rng
+        )
 
     # Initialize simulation parameters
     i_hyp = np.zeros(number_of_neurons)
@@ -370,141 +1576,215 @@ def simulation(EI_connectivity_strength, IE_connectivity_strength, II_connectivi
     h = np.zeros((number_of_neurons, 5))  # h-gate
     z = np.zeros((number_of_neurons, 5))  # z-gate
     n = np.zeros((number_of_neurons, 5))  # n-gate
-
-    # Set random initial conditions for all neurons
-    for neuron_no in range(number_of_neurons):
-        v[neuron_no, 0] = np.random.uniform(-62, -22) #mV
-        h[neuron_no, 0] = np.random.uniform(0.2, 0.8)
-        z[neuron_no, 0] = np.random.uniform(0.15, 0.25)
-        n[neuron_no, 0] = np.random.uniform(0.2, 0.8)
+    if resume_from is None:
+        v[:, 0], h[:, 0], z[:, 0], n[:, 0] = initial_conditions.T
 
     spike_threshold = 0  # Spikes are detected when voltage crosses 0 mV
-    should_record_spike = [True] * number_of_neurons  # Flag for spike detection
-    g_syn_original = np.copy(g_syn)  # Store original g_syn matrix before modification
-
-    # Decimal for exact representation to avoid floating-point errors
-    zero_point_zero_one = decimal.Decimal('0.01')
+    should_record_spike = np.ones(number_of_neurons, dtype=bool)  # Flag for spike detection
+
+    # Connectivity split by presynaptic population, which determines the synaptic reversal potential
+    # The matrices are not modified during the simulation
+    if use_sparse:
+        g_syn_from_exc = sparse.csr_matrix(g_syn[:, :number_of_exc_neurons])
+        g_syn_from_inh = sparse.csr_matrix(g_syn[:, number_of_exc_neurons:])
+    elif hasattr(g_syn, "tocsr"): # SciPy sparse matrix used with dense storage
+        g_syn_from_exc = g_syn[:, :number_of_exc_neurons].toarray()
+        g_syn_from_inh = g_syn[:, number_of_exc_neurons:].toarray()
+    else:
+        g_syn_from_exc = np.ascontiguousarray(g_syn[:, :number_of_exc_neurons])
+        g_syn_from_inh = np.ascontiguousarray(g_syn[:, number_of_exc_neurons:])
+    if checkpoint_step is None:
+        g_syn = None # Only the split matrices are used from here on, the full matrix is only kept for the checkpoint
 
-    # Initialize list which will contain values of applied currents to neuron 402 at each step
+    # Initialize list which will contain values of applied currents to the tracked neuron at each step
     exc_currs = [0]
 
+    # Applied currents of every neuron for each g_ks bin, and the bin used at each step
+    if applied_currents is None:
+        applied_currents = applied_current_table(exc_frequencies, inh_current_modifiers,
+                                                 current_modulation, inh_modulation)
+    elif len(applied_currents) != len(load_fi_curves()["g_ks_keys"]):
+        raise ValueError(f"applied_currents has {len(applied_currents)} g_ks bins, but the F-I curves have "
+                         f"{len(load_fi_curves()['g_ks_keys'])}")
+    g_ks_bins = g_ks_bin_indices(g_ks_t)
+
+    # Spike steps of each neuron (excitatory neurons first), converted to spike times in ms after the simulation
+    spike_steps = [[] for neuron_no in range(number_of_neurons)]
+
+    # Array used by the vectorized and numba engines
+    g_ks_neurons = np.zeros(number_of_neurons)
+
+    # Arrays used by the vectorized engine, which advances v, h, n and z of all neurons as one (4 x neurons) array
+    if engine == "vectorized":
+        population_state = np.zeros((4, number_of_neurons))
+        rk4_work = rk4_buffers((number_of_neurons,))
+
+    # Arrays used by the numba engine
+    if engine == "numba":
+        network_step_function = compiled_network_step()
+        spiked = np.zeros(number_of_neurons, dtype=bool)
+        unstored = np.zeros(number_of_neurons, dtype=bool)
+
+    # Exponential traces used by the "trace" synaptic kernel, one pair per neuron
+    # i_hyp = trace_d - trace_r reproduces the double exponential exp(-t / tau_d) - exp(-t / tau_r)
+    tau_d = np.concatenate((np.full(number_of_exc_neurons, tau_d_e),
+                            np.full(number_of_neurons - number_of_exc_neurons, tau_d_i)))
+    trace_d_decay = np.exp(-dt / tau_d)
+    trace_r_decay = np.exp(-dt / tau_r)
+    trace_d = np.zeros(number_of_neurons)
+    trace_r = np.zeros(number_of_neurons)
+
+    # Circular buffers of recent spike steps used by the "table" synaptic kernel, one row per neuron
+    spike_buffer = np.full((number_of_neurons, 32), empty_spike_slot, dtype=np.int64)
+    spike_buffer_position = np.zeros(number_of_neurons, dtype=np.int64)
+
+    # Look up tables indexed by the spike's lag in steps. Lags outside the window are clipped to the final, zero entry
+    kernel_by_lag = np.stack((synaptic_kernel_table(dt, tau_r, tau_d_e), synaptic_kernel_table(dt, tau_r, tau_d_i)))
+    kernel_window_steps = kernel_by_lag.shape[1] - 1
+    kernel_row = np.concatenate((np.zeros(number_of_exc_neurons, dtype=np.int64),
+                                 np.ones(number_of_neurons - number_of_exc_neurons, dtype=np.int64)))[:, None]
+    kernel_offsets = kernel_row[:, 0] * kernel_by_lag.shape[1] # Start of each neuron's table in kernel_by_lag.ravel()
+
+    # Restore the state at the end of the checkpoint's step. Arrays are copied so the checkpoint can be resumed again
+    if resume_from is not None:
+        for state, saved_state in ((v, resume_from["v"]), (h, resume_from["h"]), (n, resume_from["n"]),
+                                   (z, resume_from["z"]), (i_hyp, resume_from["i_hyp"]),
+                                   (should_record_spike, resume_from["should_record_spike"]),
+                                   (trace_d, resume_from["trace_d"]), (trace_r, resume_from["trace_r"]),
+                                   (spike_buffer_position, resume_from["spike_buffer_position"])):
+            state[:] = saved_state
+        spike_buffer = np.array(resume_from["spike_buffer"], dtype=np.int64)
+        spike_steps = [list(neuron_spike_steps) for neuron_spike_steps in resume_from["spike_steps"]]
+        exc_currs = list(resume_from["exc_currs"])
+        g_ks_t[:start_step] = resume_from["g_ks_t"][:start_step] # g_ks actually used before the checkpoint
+
+    checkpoint = None
+
+    if synchrony_monitor is not None:
+        synchrony_monitor.begin(t_max, dt, g_ks_t, number_of_exc_neurons, number_of_neurons)
+
+        # Spikes before a checkpoint are replayed, so that the monitor covers the whole simulation
+        for step, neuron_no in sorted((step, neuron_no) for neuron_no, neuron_steps in enumerate(spike_steps)
+                                      for step in neuron_steps):
+            synchrony_monitor.record(step, [neuron_no])
+
     # Computing numerical solution
-    for i in range(1, steps): # Loop over each time step in simulation
+    for i in range(start_step, steps): # Loop over each time step in simulation
         update_no = i % 5  # Updating modulo 5 index to remember only 5 values of v,h,z,n at a time
-        rounded_g_ks = decimal.Decimal(str(round(g_ks_t[i], 2)))
+
+        # Snapshot of the state at the end of the previous step
+        if checkpoint_step is not None and i == checkpoint_step + 1:
+            checkpoint = {
+                "step": i - 1,
+                "dt": dt,
+                "engine": engine,
+                "synaptic_kernel": synaptic_kernel,
+                "tracked_neuron": tracked_neuron,
+                "g_syn": g_syn, # Never modified, so shared with the checkpoint instead of copied
+                "exc_frequencies": np.copy(exc_frequencies),
+                "inh_current_modifiers": np.copy(inh_current_modifiers),
+                "v": v.copy(), "h": h.copy(), "n": n.copy(), "z": z.copy(),
+                "i_hyp": i_hyp.copy(),
+                "should_record_spike": should_record_spike.copy(),
+                "trace_d": trace_d.copy(), "trace_r": trace_r.copy(),
+                "spike_buffer": spike_buffer.copy(), "spike_buffer_position": spike_buffer_position.copy(),
+                "spike_steps": [list(neuron_spike_steps) for neuron_spike_steps in spike_steps],
+                "keep_spikes": keep_spikes, # Without kept spikes, spike_steps is empty
+                "exc_currs": list(exc_currs),
+                "g_ks_t": g_ks_t[:i].copy(),
+                # State of the Generator after all draws of the simulation, None for unseeded simulations
+                "rng_state": None if rng is None else rng.bit_generator.state,
+            }
+
+        # Applied currents for the current g_ks bin
+        app_current = applied_currents[g_ks_bins[i]]
+
+        # Store the tracked neuron's applied current
+        exc_currs.append(app_current[tracked_neuron])
 
         # Calculate 'i_hyp': component of synaptic current from spike times
         # (see equation under Network Structure in Materials and Methods)
-        for neuron_no in range(number_of_exc_neurons):
-            for spike_time in neuron_list_exc[neuron_no]["spike times"]:
-                if (dt * i - spike_time) < 50 and dt * i > 100:
-                    time_difference = dt * i - spike_time
-                    i_hyp[neuron_no] += double_exp_list1[int(round(time_difference, 2) * 100)]
-
-        for neuron_no in range(number_of_neurons - number_of_exc_neurons):
-            for spike_time in neuron_list_inh[neuron_no]["spike times"]:
-                if (dt * i - spike_time) < 50 and dt * i > 100:
-                    time_difference = dt * i - spike_time
-                    i_hyp[neuron_no + number_of_exc_neurons] += double_exp_list2[int(round(time_difference, 2) * 100)]
-
-        # Modify g_syn connectivity matrix to include respective (voltage - E_syn) term
-        # See equation under Network Structure in Materials and Methods
-
-        # EE connections
-        g_syn[:number_of_exc_neurons, :number_of_exc_neurons] *= np.reshape(
-            np.repeat((v[:number_of_exc_neurons, update_no - 1] - E_syn_exc), number_of_exc_neurons),
-            (number_of_exc_neurons, number_of_exc_neurons)
-        )
-
-        # IE connections
-        g_syn[:number_of_exc_neurons, number_of_exc_neurons:number_of_neurons] *= np.reshape(
-            np.repeat((v[:number_of_exc_neurons, update_no - 1] - E_syn_inh),
-                      number_of_neurons - number_of_exc_neurons),
-            (number_of_exc_neurons, number_of_neurons - number_of_exc_neurons)
-        )
-
-        # EI connections
-        g_syn[number_of_exc_neurons:number_of_neurons, :number_of_exc_neurons] *= np.reshape(
-            np.repeat((v[number_of_exc_neurons:number_of_neurons, update_no - 1] - E_syn_exc),
-                      number_of_exc_neurons),
-            (number_of_neurons - number_of_exc_neurons, number_of_exc_neurons)
-        )
-
-        # II connections
-        g_syn[number_of_exc_neurons:number_of_neurons, number_of_exc_neurons:number_of_neurons] *= np.reshape(
-            np.repeat((v[number_of_exc_neurons:number_of_neurons, update_no - 1] - E_syn_inh),
-                      number_of_neurons - number_of_exc_neurons),
-            (number_of_neurons - number_of_exc_neurons, number_of_neurons - number_of_exc_neurons)
-        )
-
+        # The numba engine computes it at the end of the previous step
+        if engine != "numba":
+            if synaptic_kernel == "trace":
+                trace_d *= trace_d_decay
+                trace_r *= trace_r_decay
+                if dt * i > 100:
+                    i_hyp[:] = trace_d - trace_r
+
+            elif dt * i > 100:
+                # Only spikes less than 50 ms old contribute. Most buffer slots are empty or out of the window, so only
+                # the recent spikes are looked up and summed per neuron
+                recent = np.flatnonzero(spike_buffer > i - kernel_window_steps)
+                spiking_neurons = recent // spike_buffer.shape[1]
+                lags = i - spike_buffer.ravel()[recent]
+                contributions = kernel_by_lag.ravel()[kernel_offsets[spiking_neurons] + lags]
+                i_hyp[:] = np.bincount(spiking_neurons, weights=contributions, minlength=number_of_neurons)
 
         # Synaptic current calculation
-        i_syn = g_syn @ i_hyp
-
-        # Update each excitatory neuron
-        for neuron_no in range(number_of_exc_neurons):
-            # Set applied current based on whether current modulation is applied
-            if current_modulation: # Selects a current that preserves selected firing frequency
-                neuron_list_exc[neuron_no]["current"] = fi_curves[str(rounded_g_ks)][
-                    str(take_closest(fi_curves_keys[int(rounded_g_ks / zero_point_zero_one)],
-                                     neuron_list_exc[neuron_no]["frequency"]))
-                ]
-            else:
-                neuron_list_exc[neuron_no]["current"] = fi_curves[str(1.5)][
-                    str(take_closest(fi_curves_keys[150],
-                                     neuron_list_exc[neuron_no]["frequency"]))]
-
-
-            # Store neuron 402's applied current
-            if neuron_no == 402:
-                exc_currs.append(neuron_list_exc[neuron_no]["current"])
-
-            # Runge-Kutta step
-            dh, dn, dz, dv = rk_slope(
-                v[neuron_no, update_no - 1],
-                neuron_list_exc[neuron_no]["current"],
-                i_syn[neuron_no],
-                h[neuron_no, update_no - 1],
-                n[neuron_no, update_no - 1],
-                z[neuron_no, update_no - 1],
-                g_ks_t[i],
-                timestep = dt
+        # The (voltage - E_syn) term of the equation under Network Structure in Materials and Methods depends only on
+        # the postsynaptic cell and the presynaptic population, so it scales the summed excitatory and inhibitory
+        # inputs of each cell instead of every entry of g_syn. Without any spike-driven component (e.g. in the first
+        # 100 ms), the synaptic current is exactly 0 and the matrix-vector products are skipped
+        if i_hyp.any():
+            i_syn = ((v[:, update_no - 1] - E_syn_exc) * (g_syn_from_exc @ i_hyp[:number_of_exc_neurons]) +
+                     (v[:, update_no - 1] - E_syn_inh) * (g_syn_from_inh @ i_hyp[number_of_exc_neurons:]))
+        else:
+            i_syn = np.zeros(number_of_neurons)
+
+        # The numba engine computes the RK4 step, spikes and the next step's 'i_hyp' in one call
+        if engine == "numba":
+            g_ks_neurons[:number_of_exc_neurons] = g_ks_t[i]
+            g_ks_neurons[number_of_exc_neurons:] = g_ks_t[i] if inh_modulation else 0
+
+            unstored_count = network_step_function(
+                i, update_no - 1, update_no, v, h, n, z, app_current, i_syn, g_ks_neurons, kernel_row[:, 0], i_hyp, dt,
+                spike_threshold, should_record_spike, spiked, unstored, synaptic_kernel == "trace", trace_d, trace_r,
+                trace_d_decay, trace_r_decay, spike_buffer, spike_buffer_position, kernel_by_lag, kernel_window_steps
             )
 
-            h[neuron_no, update_no] = h[neuron_no, update_no - 1] + dh
-            n[neuron_no, update_no] = n[neuron_no, update_no - 1] + dn
-            z[neuron_no, update_no] = z[neuron_no, update_no - 1] + dz
-            v[neuron_no, update_no] = v[neuron_no, update_no - 1] + dv
-
-            # Store spike time if spike is triggered and modify spike detection flag
-            should_record_spike[neuron_no] = record_spike(v[neuron_no, update_no], spike_threshold, i, should_record_spike[neuron_no], neuron_list_exc[neuron_no]["spike times"], timestep=dt)
-
-        # Update each inhibitory neuron
-        for neuron_no in range(number_of_exc_neurons, number_of_neurons):
-            inh_neuron_no = neuron_no - number_of_exc_neurons
-
-            # Set applied current based on modulation parameters
-            if current_modulation and inh_modulation:
-                neuron_list_inh[inh_neuron_no]["current"] = (
-                        inh_currents[str(rounded_g_ks)] *
-                        neuron_list_inh[inh_neuron_no]["current random seed"]
-                )
-            elif not current_modulation and inh_modulation:
-                neuron_list_inh[inh_neuron_no]["current"] = (
-                        inh_currents[str(1.5)] *
-                        neuron_list_inh[inh_neuron_no]["current random seed"]
-                )
-            else:
-                neuron_list_inh[inh_neuron_no]["current"] = (
-                        inh_currents[str(0.0)] *
-                        neuron_list_inh[inh_neuron_no]["current random seed"]
-                )
-
-            # Runge-Kutta step based on whether g_ks modulation is applied
-            if inh_modulation:
+            spiked_neurons = np.flatnonzero(spiked)
+            if keep_spikes:
+                for neuron_no in spiked_neurons:
+                    spike_steps[neuron_no].append(i)
+
+            if synchrony_monitor is not None:
+                synchrony_monitor.record(i, spiked_neurons)
+
+            # Spikes that did not fit in the recent spike buffer are stored after enlarging it
+            if unstored_count:
+                unstored_neurons = np.flatnonzero(unstored)
+                spike_buffer = store_recent_spikes(spike_buffer, spike_buffer_position, unstored_neurons, i,
+                                                   kernel_window_steps)
+                if dt * (i + 1) > 100:
+                    i_hyp[unstored_neurons] += kernel_by_lag[kernel_row[unstored_neurons, 0], 1]
+            continue
+
+        if engine == "vectorized":
+            # Inhibitory cells' g_ks is set to 0 mS without inhibitory modulation
+            g_ks_neurons[:number_of_exc_neurons] = g_ks_t[i]
+            g_ks_neurons[number_of_exc_neurons:] = g_ks_t[i] if inh_modulation else 0
+
+            # Runge-Kutta step for all neurons at once
+            for variable, population_variable in zip((v, h, n, z), population_state):
+                population_variable[:] = variable[:, update_no - 1]
+            rk4_population_step(population_state, app_current, i_syn, g_ks_neurons, dt, rk4_work)
+            for variable, population_variable in zip((v, h, n, z), population_state):
+                variable[:, update_no] = population_variable
+
+            # Store spike times of neurons that spiked and modify spike detection flags
+            spiked = record_spikes(v[:, update_no], spike_threshold, i, should_record_spike, spike_steps)
+
+        else:
+            # Spike detection flags before the update, used to find which neurons spike at this step
+            was_armed = np.copy(should_record_spike)
+
+            # Update each excitatory neuron
+            for neuron_no in range(number_of_exc_neurons):
+                # Runge-Kutta step
                 dh, dn, dz, dv = rk_slope(
                     v[neuron_no, update_no - 1],
-                    neuron_list_inh[inh_neuron_no]["current"],
+                    app_current[neuron_no],
                     i_syn[neuron_no],
                     h[neuron_no, update_no - 1],
                     n[neuron_no, update_no - 1],
@@ -513,63 +1793,353 @@ def simulation(EI_connectivity_strength, IE_connectivity_strength, II_connectivi
                     timestep = dt
                 )
 
-            else:
-                dh, dn, dz, dv = rk_slope(
-                    v[neuron_no, update_no - 1],
-                    neuron_list_inh[inh_neuron_no]["current"],
-                    i_syn[neuron_no],
-                    h[neuron_no, update_no - 1],
-                    n[neuron_no, update_no - 1],
-                    z[neuron_no, update_no - 1],
-                    0,
-                    timestep = dt
-                )
-
-            h[neuron_no, update_no] = h[neuron_no, update_no - 1] + dh
-            n[neuron_no, update_no] = n[neuron_no, update_no - 1] + dn
-            z[neuron_no, update_no] = z[neuron_no, update_no - 1] + dz
-            v[neuron_no, update_no] = v[neuron_no, update_no - 1] + dv
-
-            # Store spike time if spike is triggered and modify spike detection flag
-            should_record_spike[neuron_no] = record_spike(v[neuron_no, update_no], spike_threshold, i, should_record_spike[neuron_no], neuron_list_inh[inh_neuron_no]["spike times"], timestep=dt)
+                h[neuron_no, update_no] = h[neuron_no, update_no - 1] + dh
+                n[neuron_no, update_no] = n[neuron_no, update_no - 1] + dn
+                z[neuron_no, update_no] = z[neuron_no, update_no - 1] + dz
+                v[neuron_no, update_no] = v[neuron_no, update_no - 1] + dv
+
+                # Store spike time if spike is triggered and modify spike detection flag
+                # A time step of 1 records the spike's step number
+                should_record_spike[neuron_no] = record_spike(v[neuron_no, update_no], spike_threshold, i, should_record_spike[neuron_no], spike_steps[neuron_no], timestep=1)
+
+            # Update each inhibitory neuron
+            for neuron_no in range(number_of_exc_neurons, number_of_neurons):
+                # Runge-Kutta step based on whether g_ks modulation is applied
+                if inh_modulation:
+                    dh, dn, dz, dv = rk_slope(
+                        v[neuron_no, update_no - 1],
+                        app_current[neuron_no],
+                        i_syn[neuron_no],
+                        h[neuron_no, update_no - 1],
+                        n[neuron_no, update_no - 1],
+                        z[neuron_no, update_no - 1],
+                        g_ks_t[i],
+                        timestep = dt
+                    )
+
+                else:
+                    dh, dn, dz, dv = rk_slope(
+                        v[neuron_no, update_no - 1],
+                        app_current[neuron_no],
+                        i_syn[neuron_no],
+                        h[neuron_no, update_no - 1],
+                        n[neuron_no, update_no - 1],
+                        z[neuron_no, update_no - 1],
+                        0,
+                        timestep = dt
+                    )
+
+                h[neuron_no, update_no] = h[neuron_no, update_no - 1] + dh
+                n[neuron_no, update_no] = n[neuron_no, update_no - 1] + dn
+                z[neuron_no, update_no] = z[neuron_no, update_no - 1] + dz
+                v[neuron_no, update_no] = v[neuron_no, update_no - 1] + dv
+
+                # Store spike time if spike is triggered and modify spike detection flag
+                should_record_spike[neuron_no] = record_spike(v[neuron_no, update_no], spike_threshold, i, should_record_spike[neuron_no], spike_steps[neuron_no], timestep=1)
+
+            spiked = was_armed & ~should_record_spike
+
+        # Increment the traces or store the spike steps of neurons that spiked at this step
+        spiked_neurons = np.flatnonzero(spiked)
+        if synaptic_kernel == "trace":
+            trace_d[spiked] += 1
+            trace_r[spiked] += 1
+        else:
+            spike_buffer = store_recent_spikes(spike_buffer, spike_buffer_position, spiked_neurons, i,
+                                               kernel_window_steps)
+
+        if synchrony_monitor is not None:
+            synchrony_monitor.record(i, spiked_neurons)
+
+        # Spikes were recorded during the update, discard them if not kept
+        if not keep_spikes:
+            for neuron_no in spiked_neurons:
+                spike_steps[neuron_no].clear()
 
         # Reset before next loop
         i_hyp[:] = 0
-        np.copyto(g_syn, g_syn_original)
 
-    # Prepare spike lists for synchrony measure computation
-    exc_spike_list_for_golomb = [
-        neuron_list_exc[neuron]["spike times"] for neuron in range(number_of_exc_neurons)
-    ]
-    inh_spike_list_for_golomb = [
-        neuron_list_inh[neuron]["spike times"] for neuron in range(number_of_neurons - number_of_exc_neurons)
-    ]
+    if synchrony_monitor is not None:
+        synchrony_monitor.finish()
 
-    # Sort excitatory neuron spike lists by firing frequency for raster plots
-    neuron_list_exc_sort_order = sorted(
-        neuron_list_exc.items(),
-        key=lambda item: item[1]["frequency"],
-        reverse=True
-    )
-    neuron_list_exc_sorted = {
-        i: neuron_data for i, (original_index, neuron_data) in enumerate(neuron_list_exc_sort_order)
-    }
+    if spike_format == "arrays":
+        neuron_list_exc_sorted, neuron_list_inh = spike_trains(spike_steps, dt, exc_frequencies, inh_current_modifiers)
+    else:
+        neuron_list_exc_sorted, neuron_list_inh = spike_data(spike_steps, dt, exc_frequencies, inh_current_modifiers)
+
+    if checkpoint_time is not None:
+        return neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t, checkpoint
 
     return neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t
 
 
+def simulation_ensemble(parameter_sets, t_max, dt=0.1, g_ks_zero_time=None, engine="vectorized", synaptic_kernel="table",
+                        connectivity="auto", number_of_neurons=1000, number_of_exc_neurons=800, tracked_neuron=402,
+                        tau_r=tau_r, tau_d_e=tau_d_e, tau_d_i=tau_d_i, seed=None, spike_format="dict"):
+    """
+    Simulates several networks, one per parameter set, in a single run. The state, synaptic and applied current arrays
+    of all networks carry an extra leading batch axis and are advanced together by the vectorized RK4 step, so the
+    NumPy overhead of each step is shared across the ensemble.
+
+    Each network is set up exactly as by simulation(). With a seed, each network draws from its own stream spawned with
+    numpy.random.SeedSequence. Otherwise networks draw from NumPy's global random state one after the other, so
+    seeding with np.random.seed() gives the same networks as successive simulation() calls.
+
+    Inputs:
+        parameter_sets (list of tuples): (EI, IE, II, EE, current_modulation, inh_modulation) or
+            (EI, IE, II, EE, current_modulation, inh_modulation, static_g_ks) of each network, with the meaning of the
+            corresponding simulation() arguments. static_g_ks may be None.
+
+        t_max (int): Length of simulation in ms, shared by all networks
 
+        engine (str, optional): "vectorized" (default) or "numba", as in simulation()
 
+        dt, g_ks_zero_time, synaptic_kernel, connectivity, number_of_neurons, number_of_exc_neurons, tracked_neuron,
+        tau_r, tau_d_e, tau_d_i, spike_format (optional): As in simulation(), shared by all networks
 
+        seed (int or numpy SeedSequence, optional): Seed from which one independent stream per network is spawned.
+            Network k then matches simulation(..., seed=numpy.random.SeedSequence(seed).spawn(len(parameter_sets))[k]).
 
+    Outputs:
+        results (list of tuples): (neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t) of each network, as
+            returned by simulation() and accepted by Measure_funcs.synch_array_generator()
+    """
 
+    if engine not in ("vectorized", "numba"):
+        raise ValueError(f"Unknown engine '{engine}', expected 'vectorized' or 'numba'")
 
+    if engine == "numba" and import_numba() is None:
+        warnings.warn("Numba is not installed, using the vectorized engine instead")
+        engine = "vectorized"
 
+    if synaptic_kernel not in ("table", "trace"):
+        raise ValueError(f"Unknown synaptic_kernel '{synaptic_kernel}', expected 'table' or 'trace'")
 
+    if connectivity not in ("auto", "dense", "sparse"):
+        raise ValueError(f"Unknown connectivity '{connectivity}', expected 'auto', 'dense' or 'sparse'")
 
+    if connectivity == "sparse" and import_sparse() is None:
+        raise ImportError("connectivity='sparse' requires SciPy")
 
+    if spike_format not in ("dict", "arrays"):
+        raise ValueError(f"Unknown spike_format '{spike_format}', expected 'dict' or 'arrays'")
 
+    if not 0 <= tracked_neuron < number_of_exc_neurons < number_of_neurons:
+        raise ValueError("Expected 0 <= tracked_neuron < number_of_exc_neurons < number_of_neurons")
 
+    for parameter_set in parameter_sets:
+        if len(parameter_set) not in (6, 7):
+            raise ValueError(f"Expected 6 or 7 parameters per network, got {len(parameter_set)}")
+
+    batch_size = len(parameter_sets)
+    number_of_inh_neurons = number_of_neurons - number_of_exc_neurons
+
+    # Random number generator of each network, see simulation()
+    if seed is None:
+        member_rngs = [None] * batch_size
+    else:
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        member_rngs = [np.random.default_rng(child) for child in seed_sequence.spawn(batch_size)]
+
+    # Total number of steps in simulation
+    steps = int(t_max / dt)
+
+    # Batched arrays, with the network index first
+    g_ks_t = np.zeros((batch_size, steps))
+    inh_modulations = np.zeros(batch_size)
+    applied_currents = []
+    g_ks_bins = np.zeros((batch_size, steps), dtype=np.int64)
+    v = np.zeros((batch_size, number_of_neurons, 5))  # Voltage
+    h = np.zeros((batch_size, number_of_neurons, 5))  # h-gate
+    z = np.zeros((batch_size, number_of_neurons, 5))  # z-gate
+    n = np.zeros((batch_size, number_of_neurons, 5))  # n-gate
+    g_syn_from_exc = []
+    g_syn_from_inh = []
+    neuron_parameters = []
+    default_g_ks_t = None
+
+    # Set up each network as simulation() does
+    for member, parameter_set in enumerate(parameter_sets):
+        EI, IE, II, EE, current_modulation, inh_modulation = parameter_set[:6]
+        static_g_ks = parameter_set[6] if len(parameter_set) == 7 else None
+
+        # Computing g_ks_t
+        if static_g_ks is not None:
+            g_ks_t[member] = static_g_ks
+        else:
+            if default_g_ks_t is None:
+                default_g_ks_t = create_g_ks_t(t_max, timestep=dt, g_ks_zero_time=g_ks_zero_time)
+            g_ks_t[member] = default_g_ks_t
+        g_ks_bins[member] = g_ks_bin_indices(g_ks_t[member])
+        inh_modulations[member] = inh_modulation
+
+        # Connectivity matrix, split by presynaptic population. Each network keeps its own matrices, as a batched
+        # matrix product is slower than one BLAS matrix-vector product per network
+        if connectivity == "auto":
+            use_sparse = use_sparse_connectivity(
+                expected_connection_density(EI, IE, II, EE, number_of_exc_neurons, number_of_inh_neurons),
+                number_of_neurons
+            )
+        else:
+            use_sparse = connectivity == "sparse"
+        rng = member_rngs[member]
+        g_syn = build_connectivity(
+            EI, IE, II, EE, number_of_exc_neurons, number_of_inh_neurons,
+            rng=np.random.default_rng(np.random.randint(2 ** 32)) if rng is None else rng, sparse_output=use_sparse
+        )
+        if use_sparse:
+            g_syn_from_exc.append(sparse.csr_matrix(g_syn[:, :number_of_exc_neurons]))
+            g_syn_from_inh.append(sparse.csr_matrix(g_syn[:, number_of_exc_neurons:]))
+        else:
+            g_syn_from_exc.append(np.ascontiguousarray(g_syn[:, :number_of_exc_neurons]))
+            g_syn_from_inh.append(np.ascontiguousarray(g_syn[:, number_of_exc_neurons:]))
+        g_syn = None # Only the split matrices are used from here on
+
+        exc_frequencies, inh_current_modifiers, initial_conditions = draw_neuron_parameters(
+            number_of_neurons, number_of_exc_neurons, tracked_neuron, rng=rng
+        )
+        neuron_parameters.append((exc_frequencies, inh_current_modifiers))
+        v[member, :, 0], h[member, :, 0], z[member, :, 0], n[member, :, 0] = initial_conditions.T
+
+        applied_currents.append(applied_current_table(exc_frequencies, inh_current_modifiers,
+                                                      current_modulation, inh_modulation))
+
+    applied_currents = np.stack(applied_currents)
+
+    spike_threshold = 0  # Spikes are detected when voltage crosses 0 mV
+
+    # Per-neuron bookkeeping runs over all networks' neurons at once, network by network
+    i_hyp = np.zeros((batch_size, number_of_neurons))
+    exc_input = np.zeros((batch_size, number_of_neurons))
+    inh_input = np.zeros((batch_size, number_of_neurons))
+    should_record_spike = np.ones(batch_size * number_of_neurons, dtype=bool)  # Flag for spike detection
+    spike_steps = [[] for neuron_no in range(batch_size * number_of_neurons)]
+    g_ks_neurons = np.zeros((batch_size, number_of_neurons))
+    member_indices = np.arange(batch_size)
+
+    # Arrays used by the numba engine, which sees the networks' neurons as one flat population
+    if engine == "numba":
+        network_step_function = compiled_network_step()
+        spiked = np.zeros(batch_size * number_of_neurons, dtype=bool)
+        unstored = np.zeros(batch_size * number_of_neurons, dtype=bool)
+
+    # Arrays used by the vectorized engine, which advances v, h, n and z of all networks as one (4 x networks x neurons)
+    # array
+    else:
+        population_state = np.zeros((4, batch_size, number_of_neurons))
+        rk4_work = rk4_buffers((batch_size, number_of_neurons))
+
+    # Exponential traces used by the "trace" synaptic kernel, one pair per neuron
+    tau_d = np.concatenate((np.full(number_of_exc_neurons, tau_d_e), np.full(number_of_inh_neurons, tau_d_i)))
+    trace_d_decay = np.tile(np.exp(-dt / tau_d), batch_size)
+    trace_r_decay = np.exp(-dt / tau_r)
+    trace_d = np.zeros(batch_size * number_of_neurons)
+    trace_r = np.zeros(batch_size * number_of_neurons)
+
+    # Circular buffers of recent spike steps used by the "table" synaptic kernel, one row per neuron
+    spike_buffer = np.full((batch_size * number_of_neurons, 32), empty_spike_slot, dtype=np.int64)
+    spike_buffer_position = np.zeros(batch_size * number_of_neurons, dtype=np.int64)
+
+    # Look up tables indexed by the spike's lag in steps
+    kernel_by_lag = np.stack((synaptic_kernel_table(dt, tau_r, tau_d_e), synaptic_kernel_table(dt, tau_r, tau_d_i)))
+    kernel_window_steps = kernel_by_lag.shape[1] - 1
+    kernel_row = np.tile(np.concatenate((np.zeros(number_of_exc_neurons, dtype=np.int64),
+                                         np.ones(number_of_inh_neurons, dtype=np.int64))), batch_size)[:, None]
+    kernel_offsets = kernel_row[:, 0] * kernel_by_lag.shape[1] # Start of each neuron's table in kernel_by_lag.ravel()
+
+    # Computing numerical solution
+    for i in range(1, steps): # Loop over each time step in simulation
+        update_no = i % 5  # Updating modulo 5 index to remember only 5 values of v,h,z,n at a time
+
+        # Applied currents of each network for its current g_ks bin
+        app_current = applied_currents[member_indices, g_ks_bins[:, i]]
+
+        # Calculate 'i_hyp': component of synaptic current from spike times
+        # The numba engine computes it at the end of the previous step
+        if engine != "numba":
+            if synaptic_kernel == "trace":
+                trace_d *= trace_d_decay
+                trace_r *= trace_r_decay
+                if dt * i > 100:
+                    i_hyp.reshape(-1)[:] = trace_d - trace_r
+
+            elif dt * i > 100:
+                # Only spikes less than 50 ms old contribute, see the table kernel of simulation()
+                recent = np.flatnonzero(spike_buffer > i - kernel_window_steps)
+                spiking_neurons = recent // spike_buffer.shape[1]
+                lags = i - spike_buffer.ravel()[recent]
+                contributions = kernel_by_lag.ravel()[kernel_offsets[spiking_neurons] + lags]
+                i_hyp.reshape(-1)[:] = np.bincount(spiking_neurons, weights=contributions, minlength=i_hyp.size)
+
+        # Summed excitatory and inhibitory inputs of each cell, see the synaptic current calculation of simulation()
+        if i_hyp.any():
+            for member in range(batch_size):
+                exc_input[member] = g_syn_from_exc[member] @ i_hyp[member, :number_of_exc_neurons]
+                inh_input[member] = g_syn_from_inh[member] @ i_hyp[member, number_of_exc_neurons:]
+
+            # Synaptic current calculation
+            i_syn = ((v[:, :, update_no - 1] - E_syn_exc) * exc_input +
+                     (v[:, :, update_no - 1] - E_syn_inh) * inh_input)
+        else:
+            i_syn = np.zeros((batch_size, number_of_neurons))
+
+        # Inhibitory cells' g_ks is set to 0 mS without inhibitory modulation
+        g_ks_neurons[:, :number_of_exc_neurons] = g_ks_t[:, i, None]
+        g_ks_neurons[:, number_of_exc_neurons:] = (g_ks_t[:, i] * inh_modulations)[:, None]
+
+        # The numba engine computes the RK4 step, spikes and the next step's 'i_hyp' in one call
+        if engine == "numba":
+            unstored_count = network_step_function(
+                i, update_no - 1, update_no, v.reshape(-1, 5), h.reshape(-1, 5), n.reshape(-1, 5), z.reshape(-1, 5),
+                app_current.reshape(-1), i_syn.reshape(-1), g_ks_neurons.reshape(-1), kernel_row[:, 0],
+                i_hyp.reshape(-1), dt, spike_threshold, should_record_spike, spiked, unstored,
+                synaptic_kernel == "trace", trace_d, trace_r, trace_d_decay, trace_r_decay, spike_buffer,
+                spike_buffer_position, kernel_by_lag, kernel_window_steps
+            )
+
+            for neuron_no in np.flatnonzero(spiked):
+                spike_steps[neuron_no].append(i)
+
+            # Spikes that did not fit in the recent spike buffer are stored after enlarging it
+            if unstored_count:
+                unstored_neurons = np.flatnonzero(unstored)
+                spike_buffer = store_recent_spikes(spike_buffer, spike_buffer_position, unstored_neurons, i,
+                                                   kernel_window_steps)
+                if dt * (i + 1) > 100:
+                    i_hyp.reshape(-1)[unstored_neurons] += kernel_by_lag[kernel_row[unstored_neurons, 0], 1]
+            continue
+
+        # Runge-Kutta step for all neurons of all networks at once
+        for variable, population_variable in zip((v, h, n, z), population_state):
+            population_variable[:] = variable[:, :, update_no - 1]
+        rk4_population_step(population_state, app_current, i_syn, g_ks_neurons, dt, rk4_work)
+        for variable, population_variable in zip((v, h, n, z), population_state):
+            variable[:, :, update_no] = population_variable
+
+        # Store spike times of neurons that spiked and modify spike detection flags
+        spiked = record_spikes(v[:, :, update_no].reshape(-1), spike_threshold, i, should_record_spike, spike_steps)
+
+        # Increment the traces or store the spike steps of neurons that spiked at this step
+        if synaptic_kernel == "trace":
+            trace_d[spiked] += 1
+            trace_r[spiked] += 1
+        else:
+            spike_buffer = store_recent_spikes(spike_buffer, spike_buffer_position, np.flatnonzero(spiked), i,
+                                               kernel_window_steps)
+
+        # Reset before next loop
+        i_hyp[:] = 0
+
+    results = []
+    for member, (exc_frequencies, inh_current_modifiers) in enumerate(neuron_parameters):
+        neuron_list_exc_sorted, neuron_list_inh = (spike_trains if spike_format == "arrays" else spike_data)(
+            spike_steps[member * number_of_neurons:(member + 1) * number_of_neurons], dt,
+            exc_frequencies, inh_current_modifiers
+        )
 
+        # Applied current to the tracked neuron at each step
+        exc_currs = [0] + list(applied_currents[member, g_ks_bins[member, 1:], tracked_neuron])
 
+        results.append((neuron_list_exc_sorted, neuron_list_inh, exc_currs, g_ks_t[member]))
 
+    return results
@@ -0,0 +1,157 @@
+import numpy as np
+
+
+class SpikeTrains:
+    """
+    Spike trains of one population (excitatory or inhibitory), stored as flat arrays instead of one dictionary and
+    list of spike times per neuron.
+
+    Spike steps of all neurons are stored one neuron after the other in 'steps', neuron k's steps being
+    steps[offsets[k]:offsets[k + 1]] in chronological order. Neurons are stored in simulation order, and 'order' gives
+    the order in which they are presented (e.g. excitatory neurons sorted by firing frequency, as in the dictionaries
+    returned by simulation()), so sorting never copies the spikes.
+
+    Indexing with a neuron index in presentation order returns a view of that neuron's spike steps. Measure_funcs and
+    Plotting_funcs accept SpikeTrains wherever they accept the dictionaries returned by simulation().
+
+    Attributes:
+        steps (numpy array of int32): Spike steps of every neuron, neuron after neuron
+
+        offsets (numpy array of int64): Start of each neuron's spikes in steps, followed by len(steps)
+
+        dt (float): Integration time step in ms, converting steps to spike times
+
+        order (numpy array of int64): Stored neuron shown at each position of the presentation order
+
+        values (numpy array): Per-neuron value of the dictionaries, in stored order (firing frequency for excitatory
+                              neurons, current modifier for inhibitory neurons)
+
+        value_name (str): Key of values in the dictionaries ("frequency" or "current random seed")
+    """
+
+    def __init__(self, steps, offsets, dt, order=None, values=None, value_name="frequency"):
+        self.steps = np.asarray(steps, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.dt = float(dt)
+        number_of_cells = len(self.offsets) - 1
+        self.order = np.arange(number_of_cells) if order is None else np.asarray(order, dtype=np.int64)
+        self.values = np.zeros(number_of_cells) if values is None else np.asarray(values)
+        self.value_name = value_name
+
+    @classmethod
+    def from_step_lists(cls, spike_steps, dt, order=None, values=None, value_name="frequency"):
+        """
+        Builds spike trains from one list of spike steps per neuron, in stored order.
+        """
+        counts = np.array([len(neuron_steps) for neuron_steps in spike_steps], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        steps = np.fromiter((step for neuron_steps in spike_steps for step in neuron_steps), dtype=np.int32,
+                            count=offsets[-1])
+
+        return cls(steps, offsets, dt, order=order, values=values, value_name=value_name)
+
+    @classmethod
+    def from_dict(cls, neuron_list, dt=0.1):
+        """
+        Converts a population dictionary returned by simulation() (e.g. neuron_list_exc_sorted) to spike trains.
+        """
+        spike_steps = [np.rint(np.asarray(neuron_list[neuron]["spike times"]) / dt).astype(np.int64)
+                       for neuron in range(len(neuron_list))]
+        value_name = "frequency" if len(neuron_list) and "frequency" in neuron_list[0] else "current random seed"
+        values = [neuron_list[neuron].get(value_name, 0) for neuron in range(len(neuron_list))]
+
+        return cls.from_step_lists(spike_steps, dt, values=values, value_name=value_name)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, neuron):
+        """
+        Spike steps of a neuron, in presentation order, as a view of steps.
+        """
+        stored_neuron = self.order[neuron]
+        return self.steps[self.offsets[stored_neuron]:self.offsets[stored_neuron + 1]]
+
+    def spike_times(self, neuron):
+        """
+        Spike times of a neuron, in presentation order, in ms.
+        """
+        return self.dt * self[neuron]
+
+    @property
+    def counts(self):
+        """
+        Number of spikes of each neuron, in presentation order.
+        """
+        return np.diff(self.offsets)[self.order]
+
+    def window(self, start, end):
+        """
+        Spike trains restricted to the spikes with start <= spike time < end (in ms). Spike steps are unchanged, so
+        spike times remain measured from the start of the simulation.
+        """
+        spike_times = self.dt * self.steps
+        kept = (spike_times >= start) & (spike_times < end)
+        kept_before = np.concatenate(([0], np.cumsum(kept)))
+
+        return SpikeTrains(self.steps[kept], kept_before[self.offsets], self.dt, order=self.order,
+                           values=self.values, value_name=self.value_name)
+
+    def to_dict(self):
+        """
+        Converts the spike trains to the dictionary format returned by simulation(), in presentation order.
+        """
+        return {
+            neuron: {"current": 0, "spike times": [self.dt * step for step in self[neuron].tolist()],
+                     self.value_name: self.values[stored_neuron]}
+            for neuron, stored_neuron in enumerate(self.order)
+        }
+
+    def save(self, path):
+        """
+        Writes the spike trains to a compressed .npz file.
+        """
+        np.savez_compressed(path, steps=self.steps, offsets=self.offsets, dt=self.dt, order=self.order,
+                            values=self.values, value_name=self.value_name)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads spike trains written by save().
+        """
+        with np.load(path) as file:
+            return cls(file["steps"], file["offsets"], float(file["dt"]), order=file["order"], values=file["values"],
+                       value_name=str(file["value_name"]))
+
+
+def spike_lists(neuron_list):
+    """
+    Lists the spike times of each neuron of a population, given either as SpikeTrains or as a dictionary returned by
+    simulation().
+
+    Inputs:
+        neuron_list (SpikeTrains or dict of dicts): Spike trains of a population
+
+    Outputs:
+        spike_times (list of lists of floats): Spike times in ms of each neuron
+    """
+    if isinstance(neuron_list, SpikeTrains):
+        return [neuron_list.spike_times(neuron).tolist() for neuron in range(len(neuron_list))]
+
+    return [neuron_list[neuron]["spike times"] for neuron in range(len(neuron_list))]
+
+
+def spike_arrays(neuron_list):
+    """
+    Spike times of each neuron of a population as numpy arrays, see spike_lists().
+
+    Inputs:
+        neuron_list (SpikeTrains or dict of dicts): Spike trains of a population
+
+    Outputs:
+        spike_times (list of numpy arrays): Spike times in ms of each neuron, in chronological order
+    """
+    if isinstance(neuron_list, SpikeTrains):
+        return [neuron_list.spike_times(neuron) for neuron in range(len(neuron_list))]
+
+    return [np.asarray(neuron_list[neuron]["spike times"], dtype=float) for neuron in range(len(neuron_list))]
@@ -0,0 +1,267 @@
+import numpy as np
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+import Simul_funcs_and_data
+import Measure_funcs
+import Cache_funcs
+
+
+def grid_shape(parameter_grid):
+    """
+    Returns the shape of a parameter grid, see run_sweep().
+
+    Inputs:
+        parameter_grid (nested lists of tuples): Parameter sets arranged in nested lists
+
+    Outputs:
+        shape (tuple of ints): Length of each level of nested lists
+    """
+    if isinstance(parameter_grid, tuple):
+        return ()
+
+    shapes = {grid_shape(sub_grid) for sub_grid in parameter_grid}
+    if len(shapes) != 1:
+        raise ValueError("Parameter grid rows must all have the same shape")
+
+    return (len(parameter_grid),) + shapes.pop()
+
+
+def flatten_grid(parameter_grid):
+    """
+    Lists the parameter sets of a parameter grid in row-major order, see run_sweep().
+
+    Inputs:
+        parameter_grid (nested lists of tuples): Parameter sets arranged in nested lists
+
+    Outputs:
+        parameter_sets (list of tuples): Parameter sets in row-major order
+    """
+    if isinstance(parameter_grid, tuple):
+        return [parameter_grid]
+
+    return [parameter_set for sub_grid in parameter_grid for parameter_set in flatten_grid(sub_grid)]
+
+
+def grid_array(arrays, shape):
+    """
+    Arranges per-simulation arrays, listed in row-major grid order, into an array of the grid's shape.
+
+    Inputs:
+        arrays (list of numpy arrays): One array per grid entry
+
+        shape (tuple of ints): Shape of the grid
+
+    Outputs:
+        grid (numpy array): Array of shape (grid shape) + (array shape) if all arrays have the same shape, otherwise an
+                            object array of the grid's shape holding the arrays
+    """
+    if len({np.shape(array) for array in arrays}) == 1:
+        return np.array(arrays).reshape(shape + np.shape(arrays[0]))
+
+    grid = np.empty(len(arrays), dtype=object)
+    for index, array in enumerate(arrays):
+        grid[index] = array
+
+    return grid.reshape(shape)
+
+
+def simulate_and_measure(parameter_set, seed_sequence, bin_size, use_cache, simulation_kwargs):
+    """
+    Runs a single simulation and measures the synchrony of both populations. Executed by the sweep workers.
+
+    Inputs:
+        parameter_set (tuple): (EI, IE, II, EE, current_modulation, inh_modulation, t_max), optionally followed by
+                               static_g_ks, passed to simulation()
+
+        seed_sequence (numpy SeedSequence): Independent random stream of this simulation
+
+        bin_size (int or None): Time window size for each synchrony measurement in ms, see synch_array_generator()
+
+        use_cache (Boolean): Reuse the result of an identical earlier simulation, see Cache_funcs.cached_simulation()
+
+        simulation_kwargs (dict): Additional keyword arguments of simulation(). engine defaults to "vectorized" rather
+                                  than simulation()'s "loop"
+
+    Outputs:
+        exc_synch_array (numpy array): Golomb synchrony of excitatory cells in each bin
+
+        inh_synch_array (numpy array): Golomb synchrony of inhibitory cells in each bin
+
+        g_ks_avg_array (numpy array): Average g_ks in each bin
+
+        cache_statistics (dict): Changes of Cache_funcs.cache_statistics in this worker
+    """
+    EI, IE, II, EE, current_modulation, inh_modulation, t_max = parameter_set[:7]
+    if len(parameter_set) == 8:
+        simulation_kwargs = dict(simulation_kwargs, static_g_ks=parameter_set[7])
+
+    # Spike trains are only measured, so the compact format is enough
+    # The vectorized engine is much faster than simulation()'s default per-neuron loop. Its results are statistically
+    # equivalent to the loop's, not identical, as floating-point rounding differs between the engines
+    simulation_kwargs = dict({"spike_format": "arrays", "engine": "vectorized"}, **simulation_kwargs)
+
+    statistics_before = dict(Cache_funcs.cache_statistics)
+
+    if use_cache:
+        (neurons_exc, neurons_inh, exc_currs, g_ks_t), _ = Cache_funcs.cached_simulation(
+            EI, IE, II, EE, current_modulation, inh_modulation, t_max, seed=seed_sequence, **simulation_kwargs
+        )
+    else:
+        neurons_exc, neurons_inh, exc_currs, g_ks_t = Simul_funcs_and_data.simulation(
+            EI, IE, II, EE, current_modulation, inh_modulation, t_max, seed=seed_sequence, **simulation_kwargs
+        )
+
+    cache_statistics = {
+        name: Cache_funcs.cache_statistics[name] - statistics_before[name] for name in statistics_before
+    }
+
+    dt = simulation_kwargs.get("dt", 0.1)
+    exc_synch_array, g_ks_avg_array = Measure_funcs.synch_array_generator(
+        neurons_exc, t_max, 0, g_ks_t, dt=dt, bin_size=bin_size
+    )
+    inh_synch_array, _ = Measure_funcs.synch_array_generator(
+        neurons_inh, t_max, 1, g_ks_t, dt=dt, bin_size=bin_size
+    )
+
+    return np.array(exc_synch_array), np.array(inh_synch_array), np.array(g_ks_avg_array), cache_statistics
+
+
+def run_sweep(parameter_grid, bin_size=None, max_workers=None, seed=None, cache=False, **simulation_kwargs):
+    """
+    Runs simulation() followed by synch_array_generator() for every parameter set of a grid, in parallel over a pool
+    of worker processes.
+
+    Each simulation draws from its own random stream, spawned from 'seed' with numpy.random.SeedSequence, so results
+    do not depend on the number of workers or on which worker runs which simulation.
+
+    Scripts calling run_sweep() must guard their top-level code with if __name__ == "__main__", as the workers
+    import the main module on platforms that do not fork.
+
+    Inputs:
+        parameter_grid (nested lists of tuples):
+            Parameter sets arranged in nested lists, e.g. rows of a heatmap. Each parameter set is a tuple
+            (EI, IE, II, EE, current_modulation, inh_modulation, t_max), optionally followed by static_g_ks, with the
+            meaning of the corresponding simulation() arguments.
+
+        bin_size (int, optional): Time window size for each synchrony measurement in ms, see synch_array_generator()
+
+        max_workers (int, optional): Number of worker processes. Defaults to the number of processors.
+
+        seed (int, optional): Seed of the sweep's random streams. Fresh entropy is used if not given.
+
+        cache (Boolean, optional): Reuse simulations stored by earlier sweeps with the same seed and print a hit/miss
+                                   report, see Cache_funcs.cached_simulation(). Only used when a seed is given, as
+                                   unseeded sweeps cannot be repeated (default is False)
+
+        **simulation_kwargs: Additional keyword arguments passed to every simulation() call (e.g. engine="numba").
+                             Unlike simulation(), whose default is engine="loop", sweeps use engine="vectorized"
+                             unless another engine is given. Its synchrony values are statistically equivalent to
+                             those of the loop engine but not identical, so pass engine="loop" to reproduce
+                             loop-engine results exactly.
+
+    Outputs:
+        exc_synchrony (numpy array): Golomb synchrony of excitatory cells, of shape (grid shape) x (bins)
+
+        inh_synchrony (numpy array): Golomb synchrony of inhibitory cells, of shape (grid shape) x (bins)
+
+        g_ks_averages (numpy array): Average g_ks in each bin, of shape (grid shape) x (bins)
+
+        If the simulations do not all have the same number of bins (e.g. different t_max), the outputs are instead
+        object arrays of the grid's shape holding one array of bins per simulation.
+    """
+    shape = grid_shape(parameter_grid)
+    parameter_sets = flatten_grid(parameter_grid)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(parameter_sets))
+    cache = cache and seed is not None
+
+    # Results are returned in grid order, whichever worker finishes first
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            simulate_and_measure,
+            parameter_sets,
+            seed_sequences,
+            [bin_size] * len(parameter_sets),
+            [cache] * len(parameter_sets),
+            [simulation_kwargs] * len(parameter_sets)
+        ))
+
+    # Report how much of this sweep was reused, and add the workers' counts to this process's totals
+    if cache:
+        sweep_statistics = {name: sum(result[3][name] for result in results) for name in Cache_funcs.cache_statistics}
+        for name, change in sweep_statistics.items():
+            Cache_funcs.cache_statistics[name] += change
+        print(Cache_funcs.cache_report(sweep_statistics))
+
+    exc_synchrony, inh_synchrony, g_ks_averages = [
+        grid_array([result[output_index] for result in results], shape) for output_index in range(3)
+    ]
+
+    return exc_synchrony, inh_synchrony, g_ks_averages
+
+
+def run_replicates(parameter_grid, replicates, bin_size=None, max_workers=None, seed=None, cache=False,
+                   confidence=0.95, **simulation_kwargs):
+    """
+    Runs independent replicates of every parameter set of a grid with run_sweep(), each drawing a new network from
+    its own random stream, and summarizes the synchrony curves across replicates.
+
+    Inputs:
+        parameter_grid (nested lists of tuples): Parameter sets, see run_sweep()
+
+        replicates (int): Number of replicates of each parameter set
+
+        bin_size, max_workers, seed, cache, **simulation_kwargs (optional): See run_sweep()
+
+        confidence (float, optional): Confidence level of the bands (default is 0.95)
+
+    Outputs:
+        exc_synchrony_mean (numpy array): Mean Golomb synchrony of excitatory cells, of shape (grid shape) x (bins)
+
+        exc_synchrony_band (numpy array): Lower and upper confidence limits of the mean, of shape
+                                          (grid shape) x 2 x (bins)
+
+        inh_synchrony_mean, inh_synchrony_band (numpy arrays): The same for inhibitory cells
+
+        g_ks_averages (numpy array): Average g_ks in each bin, of shape (grid shape) x (bins)
+
+        As for run_sweep(), the outputs are object arrays of the grid's shape if the number of bins differs between
+        parameter sets. Bands are NaN with a single replicate.
+    """
+    # Replicates form the last level of the grid
+    def replicate_grid(sub_grid):
+        if isinstance(sub_grid, tuple):
+            return [sub_grid] * replicates
+        return [replicate_grid(item) for item in sub_grid]
+
+    shape = grid_shape(parameter_grid)
+    exc_synchrony, inh_synchrony, g_ks_averages = run_sweep(
+        replicate_grid(parameter_grid), bin_size=bin_size, max_workers=max_workers, seed=seed, cache=cache,
+        **simulation_kwargs
+    )
+
+    # Student's t quantile of the confidence level, or the normal quantile without SciPy
+    try:
+        from scipy import stats
+        quantile = stats.t.ppf((1 + confidence) / 2, max(replicates - 1, 1))
+    except ImportError:
+        quantile = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+    outputs = []
+    for synchrony in (exc_synchrony, inh_synchrony, g_ks_averages):
+        means = []
+        bands = []
+        for index in np.ndindex(shape):
+            replicate_curves = np.stack(synchrony[index]) # (replicates x bins)
+            mean = replicate_curves.mean(axis=0)
+            if replicates > 1:
+                half_width = quantile * replicate_curves.std(axis=0, ddof=1) / np.sqrt(replicates)
+            else:
+                half_width = np.full(mean.shape, np.nan)
+            means.append(mean)
+            bands.append(np.stack((mean - half_width, mean + half_width)))
+
+        outputs.append((grid_array(means, shape), grid_array(bands, shape)))
+
+    (exc_synchrony_mean, exc_synchrony_band), (inh_synchrony_mean, inh_synchrony_band), (g_ks_averages, _) = outputs
+
+    return exc_synchrony_mean, exc_synchrony_band, inh_synchrony_mean, inh_synchrony_band, g_ks_averages